@@ -0,0 +1,347 @@
+"""
+Fake ClickUp Server
+A local stand-in for the ClickUp API and attachment CDN, for measuring the downloader
+without touching a real workspace.
+
+Serves a synthetic workspace (spaces, folders, lists, paginated tasks, task details)
+under /api/v2 and image bytes under /attachments, with configurable latency, a
+per-minute rate limit with ClickUp's X-RateLimit-* headers, HTTP Range support and
+failure injection. Attachment URLs point at a different host name than the API
+(localhost vs 127.0.0.1 by default) so the downloader treats them as CDN traffic.
+
+Usage: python fake_clickup_server.py --tasks 10000 --port 8765
+"""
+
+import argparse
+import hashlib
+import json
+import random
+import re
+import socket
+import threading
+import time
+from dataclasses import dataclass
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl
+
+PAGE_SIZE = 100          # ClickUp returns at most 100 tasks per page
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+@dataclass
+class WorkspaceConfig:
+    spaces: int = 4
+    folders_per_space: int = 2
+    lists_per_folder: int = 3
+    loose_lists_per_space: int = 2
+    tasks: int = 1000
+    attachments_per_task: int = 2
+    image_size: int = 64 * 1024
+    api_latency: float = 0.0          # seconds added to every API response
+    cdn_latency: float = 0.0          # seconds added before every attachment body
+    rate_limit: int = 0               # API requests per minute, 0 = unlimited
+    failure_rate: float = 0.0         # fraction of requests answered with a 502
+    truncate_rate: float = 0.0        # fraction of attachment bodies cut short
+    attachment_host: str = "localhost"
+
+    @property
+    def lists_per_space(self):
+        return self.loose_lists_per_space + self.folders_per_space * self.lists_per_folder
+
+    @property
+    def total_lists(self):
+        return self.spaces * self.lists_per_space
+
+class Workspace:
+    """Deterministic synthetic workspace: every id, name and byte derives from `config`."""
+
+    def __init__(self, config):
+        self.config = config
+
+    def spaces(self):
+        return [{"id": f"s{i}", "name": f"Space {i}"} for i in range(self.config.spaces)]
+
+    def _list(self, space, index):
+        return {"id": f"{space}l{index}", "name": f"List {index}"}
+
+    def loose_lists(self, space):
+        return [self._list(space, i) for i in range(self.config.loose_lists_per_space)]
+
+    def folders(self, space):
+        c = self.config
+        folders = []
+        for f in range(c.folders_per_space):
+            first = c.loose_lists_per_space + f * c.lists_per_folder
+            folders.append({
+                "id": f"{space}f{f}",
+                "name": f"Folder {f}",
+                "lists": [self._list(space, first + i) for i in range(c.lists_per_folder)],
+            })
+        return folders
+
+    def list_task_count(self, list_id):
+        """Tasks are spread evenly over all lists, the remainder going to the first ones."""
+        match = re.fullmatch(r"s(\d+)l(\d+)", list_id)
+        if not match:
+            return None
+        position = int(match[1]) * self.config.lists_per_space + int(match[2])
+        base, extra = divmod(self.config.tasks, self.config.total_lists)
+        return base + (1 if position < extra else 0)
+
+    def task(self, list_id, index):
+        return {
+            "id": f"t{list_id}x{index}",
+            "name": f"Task {index}",
+            "description": "Synthetic task " * 20,
+            "status": {"status": "open"},
+            "date_created": str(1_600_000_000_000 + index),
+            "date_updated": str(1_700_000_000_000 + index),
+            "assignees": [{"id": 1, "username": "bench"}],
+            "custom_fields": [{"id": "cf", "name": "Field", "value": index}],
+            "list": {"id": list_id},
+        }
+
+    def task_detail(self, task_id, base_url):
+        match = re.fullmatch(r"t(s\d+l\d+)x(\d+)", task_id)
+        if not match:
+            return None
+        detail = self.task(match[1], int(match[2]))
+        detail["attachments"] = [
+            {
+                "id": f"{task_id}a{n}",
+                "title": f"{task_id}_{n}.png",
+                "mimetype": "image/png",
+                "size": self.config.image_size,
+                "url": f"{base_url}/attachments/{task_id}/{n}.png",
+            }
+            for n in range(self.config.attachments_per_task)
+        ]
+        return detail
+
+    def image(self, path):
+        seed = hashlib.sha256(path.encode()).digest()
+        body = PNG_SIGNATURE + seed * (self.config.image_size // len(seed) + 1)
+        return body[:self.config.image_size]
+
+class Stats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {}
+
+    def add(self, key, amount=1):
+        with self.lock:
+            self.counts[key] = self.counts.get(key, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+class RateWindow:
+    """Fixed one-minute window, like ClickUp's per-token limit."""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.used = 0
+
+    def hit(self):
+        """Count one request; returns (allowed, remaining, reset_epoch)."""
+        with self.lock:
+            now = time.time()
+            if now - self.start >= 60:
+                self.start, self.used = now, 0
+            self.used += 1
+            reset = int(self.start + 60)
+            return self.used <= self.limit, max(0, self.limit - self.used), reset
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "FakeClickUp/1.0"
+    disable_nagle_algorithm = True    # headers and body are separate writes
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, body=b"", content_type="application/json", headers=None):
+        self.send_response(code)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, payload, headers):
+        self._send(200, json.dumps(payload).encode(), headers=headers)
+
+    def do_GET(self):
+        server = self.server
+        url = urlsplit(self.path)
+        if random.random() < server.config.failure_rate:
+            server.stats.add("injected_failures")
+            return self._send(502, b'{"err": "injected failure"}')
+        if url.path.startswith("/api/v2/"):
+            return self._api(url)
+        if url.path.startswith("/attachments/"):
+            return self._attachment(url.path)
+        self._send(404, b'{"err": "not found"}')
+
+    def _api(self, url):
+        server = self.server
+        headers = {}
+        if server.rate:
+            allowed, remaining, reset = server.rate.hit()
+            headers = {
+                "X-RateLimit-Limit": str(server.rate.limit),
+                "X-RateLimit-Remaining": str(remaining),
+                "X-RateLimit-Reset": str(reset),
+            }
+            if not allowed:
+                server.stats.add("rate_limited")
+                return self._send(429, b'{"err": "Rate limit reached"}', headers=headers)
+        if server.config.api_latency:
+            time.sleep(server.config.api_latency)
+        server.stats.add("api_requests")
+
+        ws = server.workspace
+        path = url.path[len("/api/v2"):]
+        if re.fullmatch(r"/team/[^/]+/space", path):
+            return self._json({"spaces": ws.spaces()}, headers)
+        if match := re.fullmatch(r"/space/([^/]+)/list", path):
+            return self._json({"lists": ws.loose_lists(match[1])}, headers)
+        if match := re.fullmatch(r"/space/([^/]+)/folder", path):
+            return self._json({"folders": ws.folders(match[1])}, headers)
+        if match := re.fullmatch(r"/list/([^/]+)/task", path):
+            return self._tasks(match[1], dict(parse_qsl(url.query)), headers)
+        if match := re.fullmatch(r"/task/([^/]+)", path):
+            detail = ws.task_detail(match[1], server.attachment_base)
+            if detail is None:
+                return self._send(404, b'{"err": "Task not found"}', headers=headers)
+            server.stats.add("task_details")
+            return self._json(detail, headers)
+        self._send(404, b'{"err": "Route not found"}', headers=headers)
+
+    def _tasks(self, list_id, query, headers):
+        ws = self.server.workspace
+        count = ws.list_task_count(list_id)
+        if count is None:
+            return self._send(404, b'{"err": "List not found"}', headers=headers)
+        page = int(query.get("page", 0))
+        updated_gt = int(query.get("date_updated_gt", -1))
+        # date_updated grows with the task index, so the filter keeps a suffix of the list
+        first = max(0, updated_gt - 1_700_000_000_000 + 1) if updated_gt >= 0 else 0
+        start = first + page * PAGE_SIZE
+        stop = min(count, start + PAGE_SIZE)
+        tasks = [ws.task(list_id, i) for i in range(start, stop)]
+        self.server.stats.add("tasks_listed", len(tasks))
+        self._json({"tasks": tasks, "last_page": stop >= count}, headers)
+
+    def _attachment(self, path):
+        server = self.server
+        body = server.workspace.image(path)
+        etag = '"' + hashlib.md5(body).hexdigest() + '"'
+        if server.config.cdn_latency:
+            time.sleep(server.config.cdn_latency)
+
+        status, headers, payload = 200, {"ETag": etag}, body
+        requested = self.headers.get("Range")
+        if_range = self.headers.get("If-Range")
+        if requested and if_range in (None, etag):
+            start = int(requested.split("=", 1)[1].split("-", 1)[0])
+            if start >= len(body):
+                return self._send(416, headers={"Content-Range": f"bytes */{len(body)}"})
+            status, payload = 206, body[start:]
+            headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+            server.stats.add("range_requests")
+
+        server.stats.add("images_served")
+        if random.random() < server.config.truncate_rate:
+            # Announce the full length but hang up halfway through the body
+            server.stats.add("truncated")
+            self.send_response(status)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(payload)))
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(payload[:len(payload) // 2])
+            self.wfile.flush()
+            self.close_connection = True
+            self.connection.shutdown(socket.SHUT_RDWR)
+            server.stats.add("bytes_served", len(payload) // 2)
+            return
+        self._send(status, payload, content_type="image/png", headers=headers)
+        server.stats.add("bytes_served", len(payload))
+
+class FakeClickUpServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 256
+
+    def __init__(self, config, host="127.0.0.1", port=0):
+        super().__init__((host, port), Handler)
+        self.config = config
+        self.workspace = Workspace(config)
+        self.stats = Stats()
+        self.rate = RateWindow(config.rate_limit) if config.rate_limit else None
+        self.api_base = f"http://{host}:{self.server_address[1]}/api/v2"
+        self.attachment_base = f"http://{config.attachment_host}:{self.server_address[1]}"
+
+    def start(self):
+        """Serve on a background thread; returns self for chaining."""
+        threading.Thread(target=self.serve_forever, name="fake-clickup", daemon=True).start()
+        return self
+
+def add_config_arguments(parser):
+    defaults = WorkspaceConfig()
+    parser.add_argument("--spaces", type=int, default=defaults.spaces)
+    parser.add_argument("--folders-per-space", type=int, default=defaults.folders_per_space)
+    parser.add_argument("--lists-per-folder", type=int, default=defaults.lists_per_folder)
+    parser.add_argument("--loose-lists-per-space", type=int, default=defaults.loose_lists_per_space)
+    parser.add_argument("--attachments-per-task", type=int, default=defaults.attachments_per_task)
+    parser.add_argument("--image-size", type=int, default=defaults.image_size, help="bytes per image")
+    parser.add_argument("--api-latency", type=float, default=defaults.api_latency, help="seconds per API response")
+    parser.add_argument("--cdn-latency", type=float, default=defaults.cdn_latency, help="seconds per attachment")
+    parser.add_argument("--rate-limit", type=int, default=defaults.rate_limit,
+                        help="API requests per minute, 0 = unlimited")
+    parser.add_argument("--failure-rate", type=float, default=defaults.failure_rate,
+                        help="fraction of requests answered with 502")
+    parser.add_argument("--truncate-rate", type=float, default=defaults.truncate_rate,
+                        help="fraction of attachment bodies cut short")
+    parser.add_argument("--attachment-host", default=defaults.attachment_host,
+                        help="host name used in attachment URLs")
+
+def config_from_args(args, tasks):
+    return WorkspaceConfig(
+        spaces=args.spaces,
+        folders_per_space=args.folders_per_space,
+        lists_per_folder=args.lists_per_folder,
+        loose_lists_per_space=args.loose_lists_per_space,
+        tasks=tasks,
+        attachments_per_task=args.attachments_per_task,
+        image_size=args.image_size,
+        api_latency=args.api_latency,
+        cdn_latency=args.cdn_latency,
+        rate_limit=args.rate_limit,
+        failure_rate=args.failure_rate,
+        truncate_rate=args.truncate_rate,
+        attachment_host=args.attachment_host,
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a synthetic ClickUp workspace.")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--tasks", type=int, default=WorkspaceConfig.tasks)
+    add_config_arguments(parser)
+    args = parser.parse_args()
+
+    server = FakeClickUpServer(config_from_args(args, args.tasks), port=args.port)
+    print(f"Fake ClickUp API on {server.api_base}")
+    print(f"Run the downloader with: CLICKUP_API_BASE={server.api_base} TEAM_ID=1 CLICKUP_TOKEN=x")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    print(json.dumps(server.stats.snapshot(), indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Downloader Throughput Benchmark
+Runs clickup_get_images.main() against the local fake ClickUp server for a range of
+workspace sizes and reports tasks/s, images/s, MB/s and the downloader's peak RSS.
+
+Each run happens in a fresh child process and a fresh output directory, so numbers
+are not skewed by state from the previous run or by the fake server itself.
+
+Usage: python run_benchmark.py --sizes 1000,10000,50000,200000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+
+from fake_clickup_server import FakeClickUpServer, add_config_arguments, config_from_args
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+CHILD = ("import sys; sys.path.insert(0, {repo!r}); "
+         "import clickup_get_images; clickup_get_images.main(sys.argv[1:])")
+
+console = Console()
+
+def peak_rss_mb(usage):
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return usage.ru_maxrss * scale / 1e6
+
+def run_once(args, tasks, workdir):
+    server = FakeClickUpServer(config_from_args(args, tasks)).start()
+    env = dict(os.environ,
+               CLICKUP_API_BASE=server.api_base,
+               CLICKUP_TOKEN="benchmark",
+               TEAM_ID="1",
+               # Without rate-limit headers the client would fall back to its default quota
+               API_RATE_LIMIT=str(args.rate_limit or 1_000_000))
+    output = None if args.show_output else subprocess.DEVNULL
+    started = time.perf_counter()
+    child = subprocess.Popen([sys.executable, "-c", CHILD.format(repo=str(REPO_DIR)), *args.downloader_args],
+                             cwd=workdir, env=env, stdout=output, stderr=output)
+    _, status, usage = os.wait4(child.pid, 0)
+    child.returncode = os.waitstatus_to_exitcode(status)
+    elapsed = time.perf_counter() - started
+    server.shutdown()
+    server.server_close()
+
+    stats = server.stats.snapshot()
+    return {
+        "tasks": tasks,
+        "exit_code": child.returncode,
+        "seconds": round(elapsed, 2),
+        "tasks_per_s": round(stats.get("task_details", 0) / elapsed, 1),
+        "images_per_s": round(stats.get("images_served", 0) / elapsed, 1),
+        "mb_per_s": round(stats.get("bytes_served", 0) / 1e6 / elapsed, 2),
+        "peak_rss_mb": round(peak_rss_mb(usage), 1),
+        "api_requests": stats.get("api_requests", 0),
+        "rate_limited": stats.get("rate_limited", 0),
+        "injected_failures": stats.get("injected_failures", 0),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark clickup_get_images.py against a fake ClickUp server.")
+    parser.add_argument("--sizes", default="1000,10000,50000,200000",
+                        help="comma-separated workspace sizes, in tasks")
+    parser.add_argument("--json", type=Path, help="also write the results to this JSON file")
+    parser.add_argument("--workdir", type=Path,
+                        help="keep each run's images_download under this directory instead of a temp dir")
+    parser.add_argument("--show-output", action="store_true", help="show the downloader's own output")
+    add_config_arguments(parser)
+    parser.set_defaults(attachments_per_task=1, image_size=16 * 1024)
+    args, args.downloader_args = parser.parse_known_args()
+    sizes = [int(size) for size in args.sizes.split(",")]
+
+    results = []
+    for tasks in sizes:
+        console.print(f"[bold green]Running {tasks} tasks...[/bold green]")
+        if args.workdir:
+            workdir = args.workdir / f"tasks_{tasks}"
+            workdir.mkdir(parents=True, exist_ok=True)
+            results.append(run_once(args, tasks, workdir))
+        else:
+            with tempfile.TemporaryDirectory(prefix="clickup_bench_") as workdir:
+                results.append(run_once(args, tasks, workdir))
+
+    table = Table(title="Downloader throughput")
+    columns = ["tasks", "seconds", "tasks_per_s", "images_per_s", "mb_per_s", "peak_rss_mb",
+               "api_requests", "rate_limited", "injected_failures", "exit_code"]
+    for column in columns:
+        table.add_column(column.replace("_per_s", "/s").replace("_", " "), justify="right")
+    for result in results:
+        table.add_row(*(str(result[column]) for column in columns))
+    console.print(table)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+        console.print(f"[green]✓[/green] Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
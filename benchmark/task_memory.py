@@ -0,0 +1,82 @@
+"""
+Task Record Memory Comparison
+Measures what the downloader would retain per enumerated task: the full task JSON
+returned by /list/{id}/task versus the compact TaskRef the pipeline keeps.
+
+Tasks come from the fake server's synthetic workspace and go through json.loads page
+by page, like real responses, so every string is a separate object. Memory is
+measured with tracemalloc, for the whole workspace and for a full task queue
+(TASK_QUEUE_SIZE tasks, the most the pipeline holds at once).
+
+Usage: python task_memory.py --tasks 100000
+"""
+
+import argparse
+import gc
+import json
+import sys
+import tracemalloc
+from pathlib import Path
+from rich.console import Console
+from rich.table import Table
+
+from fake_clickup_server import PAGE_SIZE, Workspace, WorkspaceConfig
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from clickup_get_images import TASK_QUEUE_SIZE, TaskRef
+
+console = Console()
+
+def pages(workspace):
+    """Every list's task pages as a real response would decode: (list_id, [task dicts])."""
+    for s in range(workspace.config.spaces):
+        space = f"s{s}"
+        lists = workspace.loose_lists(space) + [l for f in workspace.folders(space) for l in f["lists"]]
+        for lst in lists:
+            count = workspace.list_task_count(lst["id"])
+            for start in range(0, count, PAGE_SIZE):
+                page = [workspace.task(lst["id"], i) for i in range(start, min(start + PAGE_SIZE, count))]
+                yield lst["id"], json.loads(json.dumps({"tasks": page}))["tasks"]
+
+def measure(workspace, limit, keep):
+    """Bytes retained by the first `limit` tasks when each is kept as `keep(task, list_id)`."""
+    gc.collect()
+    tracemalloc.start()
+    retained = []
+    for list_id, tasks in pages(workspace):
+        retained.extend(keep(task, list_id) for task in tasks[:limit - len(retained)])
+        if len(retained) >= limit:
+            break
+    del tasks
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return current, len(retained)
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare memory held by full task JSON and by TaskRef records.")
+    parser.add_argument("--tasks", type=int, default=100_000, help="synthetic workspace size")
+    parser.add_argument("--json", type=Path, help="also write the results to this JSON file")
+    args = parser.parse_args()
+    workspace = Workspace(WorkspaceConfig(tasks=args.tasks))
+
+    results = []
+    for scope, limit in (("workspace", args.tasks), ("task queue", TASK_QUEUE_SIZE)):
+        for record, keep in (("full JSON", lambda task, list_id: task), ("TaskRef", TaskRef.from_json)):
+            current, count = measure(workspace, limit, keep)
+            results.append({"scope": scope, "record": record, "tasks": count, "mb": round(current / 1e6, 2),
+                            "bytes_per_task": round(current / count)})
+
+    table = Table(title=f"Retained task records ({args.tasks} tasks)")
+    for column in ("scope", "record", "tasks", "mb", "bytes_per_task"):
+        table.add_column(column.replace("_", " "), justify="left" if column in ("scope", "record") else "right")
+    for result in results:
+        table.add_row(*(str(value) for value in result.values()))
+    console.print(table)
+
+    if args.json:
+        args.json.write_text(json.dumps(results, indent=2))
+        console.print(f"[green]✓[/green] Results written to {args.json}")
+
+if __name__ == "__main__":
+    main()
@@ -3,13 +3,23 @@ ClickUp Image Downloader
 Downloads all image attachments from a ClickUp Workspace with resume capability.
 
 Requires: requests, python-dotenv, rich
-Usage: python clickup_get_images.py
+Usage: python clickup_get_images.py [--incremental] [--retry-failed] [--blob-store] [--profile [PATH]]
+       [--headless [--events PATH]] [--shard I/N]
+       python clickup_get_images.py plan [MANIFEST] | execute MANIFEST [--slice START:END|I/N]
+       python clickup_get_images.py merge-state [--remove]
 """
 
-import os, time, requests, pathlib, math, json, hashlib
+import os, time, requests, pathlib, math, json, hashlib, threading, sqlite3, atexit, argparse, queue, base64, re, random, sys, cProfile, pstats, itertools, zlib
+import profile as pyprofile
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from contextlib import contextmanager, nullcontext
+from dataclasses import dataclass, field, asdict
+from typing import Optional
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
 from rich.console import Console
-from rich.progress import Progress, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn, TimeElapsedColumn, MofNCompleteColumn
+from rich.progress import Progress, ProgressColumn, SpinnerColumn, TextColumn, BarColumn, TaskProgressColumn, TimeElapsedColumn, MofNCompleteColumn
 from rich.table import Table
 from rich.panel import Panel
 from rich.text import Text
@@ -18,27 +28,670 @@ load_dotenv()
 TOKEN = os.getenv("CLICKUP_TOKEN")
 TEAM  = os.getenv("TEAM_ID")
 HEAD  = {"Authorization": TOKEN}
-BASE  = "https://api.clickup.com/api/v2"
+BASE  = os.getenv("CLICKUP_API_BASE", "https://api.clickup.com/api/v2")
 OUT_DIR = pathlib.Path("images_download")
+STATE_DB = OUT_DIR / ".state.db"
+CACHE_DB = OUT_DIR / ".cache.db"  # API response cache; safe to delete at any time
+HIERARCHY_TTL = float(os.getenv("HIERARCHY_TTL", "3600"))  # seconds a cached space/folder/list tree is reused, 0 = never
+BLOB_DIR = OUT_DIR / ".blobs"     # content-addressed store used with --blob-store
+METRICS_JSON = OUT_DIR / ".metrics.json"
+METRICS_PROM = OUT_DIR / ".metrics.prom"   # Prometheus text format, e.g. for node_exporter's textfile collector
+METRICS_INTERVAL = 30.0                    # seconds between metric snapshots during a run
+PROFILE_FILE = OUT_DIR / ".profile.pstats" # default --profile output
+# Pre-SQLite bookkeeping files, imported once into STATE_DB
 METADATA_FILE = OUT_DIR / ".download_metadata.json"
 FAILED_DOWNLOADS_FILE = OUT_DIR / ".failed_downloads.json"
 PROCESSED_TASKS_FILE = OUT_DIR / ".processed_tasks.json"
 console = Console()
-RATE_DELAY = 0.6           # seconds between requests (≈85 req/min)
+API_RATE_LIMIT = int(os.getenv("API_RATE_LIMIT", "100"))   # requests/minute allowed for the token
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "8"))
+API_WORKERS = int(os.getenv("API_WORKERS", "4"))   # concurrent task-detail fetches
+# Independent budgets for api.clickup.com and the attachment CDN (every other host);
+# the concurrency values are upper bounds for the adaptive windows
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", str(API_WORKERS)))
+CDN_CONCURRENCY = int(os.getenv("CDN_CONCURRENCY", str(DOWNLOAD_WORKERS)))
+CDN_RATE_LIMIT = int(os.getenv("CDN_RATE_LIMIT", "0"))   # requests/minute, 0 = unlimited
+TASK_QUEUE_SIZE = 1000      # tasks enumerated ahead of the detail workers
+SCAN_WORKERS = int(os.getenv("SCAN_WORKERS", "16"))   # parallel directory scans when indexing OUT_DIR at startup
+STATE_FLUSH_EVERY = 500       # buffered state writes before a flush
+STATE_FLUSH_INTERVAL = 5.0    # ...or seconds since the last flush, whichever comes first
+WATERMARK_OVERLAP_MS = 60_000   # margin under a list's enumeration start time, for clock skew with ClickUp
+PROGRESS_INTERVAL = float(os.getenv("PROGRESS_INTERVAL", "5"))   # seconds between --headless progress events
 
-def load_metadata():
-    if METADATA_FILE.exists():
+STATE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS downloads (
+    path TEXT PRIMARY KEY,
+    url TEXT NOT NULL,
+    size INTEGER,
+    downloaded_at REAL
+);
+CREATE INDEX IF NOT EXISTS downloads_url ON downloads (url);
+CREATE TABLE IF NOT EXISTS processed_tasks (
+    task_id TEXT PRIMARY KEY,
+    processed_at REAL
+);
+CREATE TABLE IF NOT EXISTS failed_downloads (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    url TEXT NOT NULL,
+    dest TEXT NOT NULL,
+    error TEXT,
+    failed_at REAL
+);
+CREATE INDEX IF NOT EXISTS failed_downloads_url ON failed_downloads (url);
+CREATE INDEX IF NOT EXISTS failed_downloads_dest ON failed_downloads (dest);
+"""
+
+CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS task_details (
+    task_id TEXT PRIMARY KEY,
+    date_updated INTEGER NOT NULL,
+    attachments BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS hierarchy (
+    team_id TEXT PRIMARY KEY,
+    fetched_at REAL NOT NULL,
+    tree BLOB NOT NULL
+);
+"""
+
+# Attachment fields the downloader reads; the cache keeps only these
+ATTACHMENT_FIELDS = ("id", "title", "filename", "mimetype", "url", "size")
+
+# Applied in order on top of STATE_SCHEMA; PRAGMA user_version counts those already applied
+STATE_MIGRATIONS = [
+    """
+    ALTER TABLE processed_tasks ADD COLUMN date_updated INTEGER;
+    CREATE TABLE IF NOT EXISTS list_watermarks (
+        list_id TEXT PRIMARY KEY,
+        date_updated INTEGER NOT NULL
+    );
+    """,
+    """
+    ALTER TABLE downloads ADD COLUMN sha256 TEXT;
+    CREATE INDEX IF NOT EXISTS downloads_sha256 ON downloads (sha256);
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS partial_downloads (
+        path TEXT PRIMARY KEY,
+        url TEXT NOT NULL,
+        validator TEXT,
+        size INTEGER
+    );
+    """,
+    """
+    ALTER TABLE failed_downloads ADD COLUMN retryable INTEGER NOT NULL DEFAULT 1;
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS attachments (
+        attachment_id TEXT PRIMARY KEY,
+        path TEXT NOT NULL
+    );
+    CREATE UNIQUE INDEX IF NOT EXISTS attachments_path ON attachments (path);
+    """,
+]
+
+class EventLog:
+    """JSON-lines event stream used instead of rich output in --headless mode."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.lock = threading.Lock()
+
+    def emit(self, event, **fields):
+        line = json.dumps({'ts': round(time.time(), 3), 'event': event, **fields})
+        with self.lock:
+            self.stream.write(line + "\n")
+            self.stream.flush()
+
+EVENTS = None   # an EventLog in --headless mode
+
+def report(markup, event=None, **fields):
+    """Print `markup` on the console, or in headless mode emit `event` (if any) instead."""
+    if EVENTS is None:
+        console.print(markup)
+    elif event:
+        EVENTS.emit(event, **fields)
+
+class StateStore:
+    """SQLite (WAL mode) store for downloads, processed tasks and failed downloads.
+
+    The downloads table is loaded once into an in-memory index that answers
+    duplicate checks without touching the database. Writes are buffered in order
+    and flushed as one transaction every STATE_FLUSH_EVERY events or
+    STATE_FLUSH_INTERVAL seconds, and on close/exit. A background thread makes
+    the interval hold even when no further writes arrive.
+    """
+
+    def __init__(self, path=STATE_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(STATE_SCHEMA)
+        self._migrate_schema()
+        self._migrate_json()
+        self._load_index()
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.closed = threading.Event()
+        threading.Thread(target=self._flush_periodically, name="state-flush", daemon=True).start()
+
+    def _flush_periodically(self):
+        while not self.closed.wait(STATE_FLUSH_INTERVAL):
+            with self.lock:
+                if self.conn is not None and time.monotonic() - self.last_flush >= STATE_FLUSH_INTERVAL:
+                    self._flush()
+
+    def _load_index(self):
+        self.downloads = {
+            path: {'url': url, 'size': size}
+            for path, url, size in self.conn.execute("SELECT path, url, size FROM downloads")
+        }
+        self.partials = {
+            path: {'url': url, 'validator': validator, 'size': size}
+            for path, url, validator, size in self.conn.execute(
+                "SELECT path, url, validator, size FROM partial_downloads")
+        }
+        self.attachment_paths = dict(self.conn.execute("SELECT attachment_id, path FROM attachments"))
+        self.path_owners = {path: attachment_id for attachment_id, path in self.attachment_paths.items()}
+
+    def _migrate_schema(self):
+        version = self.conn.execute("PRAGMA user_version").fetchone()[0]
+        for number, script in enumerate(STATE_MIGRATIONS[version:], start=version + 1):
+            # executescript() commits on its own, so bump user_version in the same script
+            self.conn.executescript(f"BEGIN; {script}; PRAGMA user_version = {number}; COMMIT;")
+
+    def _migrate_json(self):
+        """Import the legacy JSON bookkeeping files once, then rename them aside."""
+        legacy = [f for f in (METADATA_FILE, PROCESSED_TASKS_FILE, FAILED_DOWNLOADS_FILE) if f.exists()]
+        if not legacy:
+            return
+        metadata = _load_json(METADATA_FILE, {})
+        processed = _load_json(PROCESSED_TASKS_FILE, [])
+        failed = _load_json(FAILED_DOWNLOADS_FILE, [])
+        with self.lock, self.conn:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO downloads (path, url, size, downloaded_at) VALUES (?, ?, ?, ?)",
+                [(k, v.get('url', ''), v.get('size'), v.get('downloaded_at')) for k, v in metadata.items()])
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO processed_tasks (task_id, processed_at) VALUES (?, NULL)",
+                [(task_id,) for task_id in processed])
+            self.conn.executemany(
+                "INSERT INTO failed_downloads (url, dest, error, failed_at) VALUES (?, ?, ?, ?)",
+                [(f.get('url', ''), f.get('dest', ''), f.get('error'), f.get('failed_at')) for f in failed])
+        for f in legacy:
+            f.rename(f.with_name(f.name + ".migrated"))
+        report(f"[green]✓[/green] Migrated {len(metadata)} downloads, {len(processed)} processed tasks "
+               f"and {len(failed)} failures into {self.path.name}",
+               "migrated", downloads=len(metadata), processed_tasks=len(processed), failures=len(failed))
+
+    def download_record(self, file_key):
+        with self.lock:
+            return self.downloads.get(file_key)
+
+    def attachment_path(self, attachment_id, file_key, url):
+        """The output key of an attachment, assigned once and kept across runs.
+
+        An attachment gets `file_key` unless it is taken, in which case its id is
+        added to the name: image.png -> image-<id>.png (then image-<id>-2.png, ...).
+        A key is taken when another attachment holds it, or when a download of a
+        different URL is already recorded there.
+
+        Names are first come, first served: which of two same-titled attachments
+        keeps the plain name depends on which task a detail worker finishes first,
+        so it can differ between fresh runs, `plan`s and shards. Once stored, an
+        assignment never changes, so keep one state database (or merge the shard
+        partitions) per output directory, and execute a manifest rather than
+        re-planning it on the target machine.
+        """
+        with self.lock:
+            assigned = self.attachment_paths.get(attachment_id)
+            if assigned is not None:
+                return assigned
+            for file_key in attachment_keys(file_key, attachment_id):
+                recorded = self.downloads.get(file_key)
+                if file_key not in self.path_owners and (recorded is None or recorded['url'] == url):
+                    break
+            self.attachment_paths[attachment_id] = file_key
+            self.path_owners[file_key] = attachment_id
+            self._write("INSERT INTO attachments (attachment_id, path) VALUES (?, ?)", (attachment_id, file_key))
+            return file_key
+
+    def _merge_conflicts(self, name):
+        """Paths the attached partition gave to a different attachment than this store did.
+
+        Shards that each thought a path was free both hand it out. This store's
+        attachment keeps it; the partition's gets a free name, as attachment_path
+        would have given it, and is queued for --retry-failed. If a shard sharing
+        OUT_DIR overwrote the holder's file, that download is queued again too.
+        """
+        self.conn.execute("CREATE TEMP TABLE IF NOT EXISTS merge_conflicts (path TEXT PRIMARY KEY)")
+        self.conn.execute("DELETE FROM merge_conflicts")
+        self.conn.execute(
+            "INSERT INTO merge_conflicts (path) SELECT DISTINCT p.path FROM part.attachments p "
+            "JOIN attachments a ON a.path = p.path AND a.attachment_id != p.attachment_id")
+        losers = self.conn.execute(
+            "SELECT p.attachment_id, p.path FROM part.attachments p JOIN merge_conflicts c ON c.path = p.path "
+            "WHERE NOT EXISTS (SELECT 1 FROM attachments a WHERE a.attachment_id = p.attachment_id)").fetchall()
+        now = time.time()
+        for attachment_id, file_key in losers:
+            new_key = next(key for key in attachment_keys(file_key, attachment_id) if not self.conn.execute(
+                "SELECT 1 FROM attachments WHERE path = ?1 UNION ALL SELECT 1 FROM part.attachments WHERE path = ?1 "
+                "UNION ALL SELECT 1 FROM downloads WHERE path = ?1 UNION ALL SELECT 1 FROM part.downloads WHERE path = ?1",
+                (key,)).fetchone())
+            self.conn.execute("INSERT INTO attachments (attachment_id, path) VALUES (?, ?)", (attachment_id, new_key))
+            source = self.conn.execute(
+                "SELECT url FROM part.downloads WHERE path = ?1 UNION ALL SELECT url FROM part.failed_downloads WHERE dest = ?1 "
+                "UNION ALL SELECT url FROM part.partial_downloads WHERE path = ?1", (file_key,)).fetchone()
+            if source:
+                self.conn.execute(
+                    "INSERT INTO failed_downloads (url, dest, error, failed_at, retryable) VALUES (?, ?, ?, ?, 1)",
+                    (source[0], new_key, f"renamed from {file_key} while merging {name}", now))
+            holder = self.conn.execute("SELECT url, size, sha256 FROM downloads WHERE path = ?", (file_key,)).fetchone()
+            if holder and not _holds(OUT_DIR / file_key, holder[1], holder[2]):
+                self.conn.execute("DELETE FROM downloads WHERE path = ?", (file_key,))
+                self.conn.execute(
+                    "INSERT INTO failed_downloads (url, dest, error, failed_at, retryable) VALUES (?, ?, ?, ?, 1)",
+                    (holder[0], file_key, f"overwritten by the shard of {name}", now))
+        return len(losers)
+
+    def _write(self, sql, params):
+        """Buffer one write; caller holds `lock`."""
+        self.pending.append((sql, params))
+        if (len(self.pending) >= STATE_FLUSH_EVERY
+                or time.monotonic() - self.last_flush >= STATE_FLUSH_INTERVAL):
+            self._flush()
+
+    def _flush(self):
+        if self.pending:
+            with PHASES.time("state persistence"), self.conn:
+                for sql, params in self.pending:
+                    self.conn.execute(sql, params)
+            self.pending.clear()
+        self.last_flush = time.monotonic()
+
+    def flush(self):
+        with self.lock:
+            self._flush()
+
+    def record_download(self, file_key, url, size, sha256=None):
+        with self.lock:
+            self.downloads[file_key] = {'url': url, 'size': size}
+            self._write(
+                "INSERT OR REPLACE INTO downloads (path, url, size, downloaded_at, sha256) VALUES (?, ?, ?, ?, ?)",
+                (file_key, url, size, time.time(), sha256))
+
+    def log_failure(self, url, dest_key, error, retryable=True):
+        with self.lock:
+            self._write(
+                "INSERT INTO failed_downloads (url, dest, error, failed_at, retryable) VALUES (?, ?, ?, ?, ?)",
+                (url, dest_key, error, time.time(), int(retryable)))
+
+    def clear_failures(self, dest_key):
+        with self.lock:
+            self._write("DELETE FROM failed_downloads WHERE dest = ?", (dest_key,))
+
+    def retryable_failures(self):
+        """Latest (dest, url) logged for every destination whose last failure was retryable."""
+        with self.lock:
+            self._flush()
+            return self.conn.execute(
+                "SELECT dest, url FROM failed_downloads f WHERE retryable = 1 AND id = "
+                "(SELECT MAX(id) FROM failed_downloads WHERE dest = f.dest) ORDER BY id").fetchall()
+
+    def partial(self, file_key):
+        """Validator and expected size of an interrupted download's .part file, if any."""
+        with self.lock:
+            return self.partials.get(file_key)
+
+    def set_partial(self, file_key, url, validator, size):
+        with self.lock:
+            self.partials[file_key] = {'url': url, 'validator': validator, 'size': size}
+            self._write(
+                "INSERT OR REPLACE INTO partial_downloads (path, url, validator, size) VALUES (?, ?, ?, ?)",
+                (file_key, url, validator, size))
+
+    def clear_partial(self, file_key):
+        with self.lock:
+            if self.partials.pop(file_key, None) is None:
+                return
+            self._write("DELETE FROM partial_downloads WHERE path = ?", (file_key,))
+
+    def processed_tasks(self):
+        """Map each processed task id to the `date_updated` it was processed at (or None)."""
+        with self.lock:
+            self._flush()
+            return dict(self.conn.execute("SELECT task_id, date_updated FROM processed_tasks"))
+
+    def mark_processed(self, task_id, date_updated=None):
+        with self.lock:
+            self._write(
+                "INSERT OR REPLACE INTO processed_tasks (task_id, processed_at, date_updated) VALUES (?, ?, ?)",
+                (task_id, time.time(), date_updated))
+
+    def watermark(self, list_id):
+        with self.lock:
+            self._flush()
+            row = self.conn.execute(
+                "SELECT date_updated FROM list_watermarks WHERE list_id = ?", (list_id,)).fetchone()
+        return row[0] if row else None
+
+    def set_watermark(self, list_id, date_updated):
+        with self.lock:
+            self._write(
+                "INSERT INTO list_watermarks (list_id, date_updated) VALUES (?, ?) "
+                "ON CONFLICT (list_id) DO UPDATE SET date_updated = MAX(date_updated, excluded.date_updated)",
+                (list_id, date_updated))
+
+    def merge(self, path):
+        """Fold a --shard partition into this store. Merging the same partition twice is harmless.
+
+        Rows for paths the partition gave to another attachment are left out;
+        see _merge_conflicts.
+        """
+        with self.lock:
+            self._flush()
+            self.conn.execute("ATTACH DATABASE ? AS part", (str(path),))
+            try:
+                counts = dict.fromkeys(("downloads", "processed_tasks", "failed_downloads"), 0)
+
+                def apply(table, sql):
+                    # Rows this partition actually added or changed, not the ones it was seeded with
+                    before = self.conn.total_changes
+                    self.conn.execute(sql)
+                    if table:
+                        counts[table] += self.conn.total_changes - before
+
+                with self.conn:
+                    counts['renamed'] = self._merge_conflicts(path.name)
+                    # Failures the shard has since downloaded are resolved
+                    apply(None,
+                        "DELETE FROM failed_downloads WHERE EXISTS (SELECT 1 FROM part.downloads d "
+                        "WHERE d.path = failed_downloads.dest AND d.downloaded_at >= failed_downloads.failed_at "
+                        "AND d.path NOT IN merge_conflicts)")
+                    apply("downloads",
+                        "INSERT INTO downloads (path, url, size, downloaded_at, sha256) "
+                        "SELECT path, url, size, downloaded_at, sha256 FROM part.downloads "
+                        "WHERE path NOT IN merge_conflicts "
+                        "ON CONFLICT (path) DO UPDATE SET url = excluded.url, size = excluded.size, "
+                        "downloaded_at = excluded.downloaded_at, sha256 = excluded.sha256 "
+                        "WHERE excluded.downloaded_at > COALESCE(downloads.downloaded_at, 0)")
+                    apply("processed_tasks",
+                        "INSERT INTO processed_tasks (task_id, processed_at, date_updated) "
+                        "SELECT task_id, processed_at, date_updated FROM part.processed_tasks WHERE true "
+                        "ON CONFLICT (task_id) DO UPDATE SET processed_at = excluded.processed_at, "
+                        "date_updated = excluded.date_updated "
+                        "WHERE COALESCE(excluded.date_updated, -1) >= COALESCE(processed_tasks.date_updated, -1) "
+                        "AND (excluded.processed_at IS NOT processed_tasks.processed_at "
+                        "OR excluded.date_updated IS NOT processed_tasks.date_updated)")
+                    apply(None,
+                        "INSERT INTO list_watermarks (list_id, date_updated) "
+                        "SELECT list_id, date_updated FROM part.list_watermarks WHERE true "
+                        "ON CONFLICT (list_id) DO UPDATE SET date_updated = MAX(date_updated, excluded.date_updated)")
+                    apply("failed_downloads",
+                        "INSERT INTO failed_downloads (url, dest, error, failed_at, retryable) "
+                        "SELECT url, dest, error, failed_at, retryable FROM part.failed_downloads p "
+                        "WHERE dest NOT IN merge_conflicts AND NOT EXISTS (SELECT 1 FROM failed_downloads f "
+                        "WHERE f.dest = p.dest AND f.url = p.url AND f.failed_at IS p.failed_at) "
+                        "AND NOT EXISTS (SELECT 1 FROM downloads d WHERE d.path = p.dest AND d.downloaded_at >= p.failed_at)")
+                    apply(None,
+                        "INSERT OR IGNORE INTO attachments (attachment_id, path) "
+                        "SELECT attachment_id, path FROM part.attachments")
+                    apply(None,
+                        "DELETE FROM partial_downloads WHERE path IN (SELECT path FROM part.downloads) "
+                        "AND path NOT IN merge_conflicts")
+                    apply(None,
+                        "INSERT OR REPLACE INTO partial_downloads (path, url, validator, size) "
+                        "SELECT path, url, validator, size FROM part.partial_downloads WHERE path NOT IN merge_conflicts")
+            finally:
+                self.conn.execute("DETACH DATABASE part")
+            self._load_index()
+            return counts
+
+    def close(self):
+        self.closed.set()
+        with self.lock:
+            if self.conn is None:
+                return
+            self._flush()
+            self.conn.close()
+            self.conn = None
+
+def attachment_keys(file_key, attachment_id):
+    """Candidate output keys for an attachment, best first: image.png, image-<id>.png, image-<id>-2.png, ..."""
+    stem, ext = os.path.splitext(file_key)
+    return itertools.chain(
+        (file_key, f"{stem}-{attachment_id}{ext}"),
+        (f"{stem}-{attachment_id}-{n}{ext}" for n in itertools.count(2)))
+
+def _holds(path, size, sha256):
+    """Whether the file at `path` is the recorded download (by SHA-256 when one was recorded)."""
+    try:
+        if path.stat().st_size != size:
+            return False
+    except OSError:
+        return False
+    if sha256 is None:
+        return True
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest() == sha256
+
+def _load_json(path, default):
+    if path.exists():
         try:
-            with open(METADATA_FILE, 'r') as f:
+            with open(path, 'r') as f:
                 return json.load(f)
         except (json.JSONDecodeError, IOError):
-            return {}
-    return {}
+            return default
+    return default
+
+SHARD = None    # (index, count) with --shard
+_state = None
+_files = None
+_cache = None
+_cache_lock = threading.Lock()   # detail workers may ask for the cache at the same moment
+
+def shard_path(path, shard=None):
+    """`path` with the shard tag before its suffix (.state.db -> .state.shard-0-of-4.db) when sharding."""
+    shard = shard or SHARD
+    if shard is None:
+        return path
+    index, count = shard
+    return path.with_name(f"{path.stem}.shard-{index}-of-{count}{path.suffix}")
+
+def seed_partition(path):
+    """Start a new shard partition as a copy of the canonical state, minus its failure log."""
+    if path.exists() or not STATE_DB.exists():
+        return
+    source, target = sqlite3.connect(STATE_DB), sqlite3.connect(path)
+    try:
+        source.backup(target)
+        with target:
+            # Another shard may own those downloads; each partition only replays its own failures
+            target.execute("DELETE FROM failed_downloads")
+    finally:
+        source.close()
+        target.close()
+
+def get_state():
+    global _state
+    if _state is None:
+        path = shard_path(STATE_DB)
+        if SHARD:
+            seed_partition(path)
+        _state = StateStore(path)
+        atexit.register(_state.close)
+    return _state
+
+def merge_state(remove=False):
+    """Merge every --shard partition in OUT_DIR into the canonical STATE_DB."""
+    partitions = sorted(OUT_DIR.glob(f"{STATE_DB.stem}.shard-*-of-*{STATE_DB.suffix}"))
+    merged = []
+    for path in partitions:
+        StateStore(path).close()    # bring the partition's schema up to date first
+        merged.append((path, get_state().merge(path)))
+        if remove:
+            for f in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+                f.unlink(missing_ok=True)
+            # The shard's metrics snapshots and any per-shard cache from older versions
+            suffix = path.name[len(STATE_DB.stem):-len(STATE_DB.suffix)]
+            for f in (*OUT_DIR.glob(f"{METRICS_JSON.stem}{suffix}*"), *OUT_DIR.glob(f"{CACHE_DB.stem}{suffix}*")):
+                f.unlink(missing_ok=True)
+    get_state().flush()
+    return merged
+
+class FileIndex:
+    """Size and mtime of every file under `root`, read once by a parallel os.scandir walk.
+
+    Existence and size checks during the run are answered from memory, which
+    matters on network filesystems where every stat() is a round trip.
+    Dot-directories such as .blobs are not indexed.
+    """
+
+    def __init__(self, root=OUT_DIR, workers=SCAN_WORKERS):
+        self.root = str(root)
+        self.lock = threading.Lock()
+        self.files = {}
+        if os.path.isdir(self.root):
+            self._walk(max(1, workers))
+
+    def _scan(self, directory):
+        files, subdirs = [], []
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if not entry.name.startswith("."):
+                            subdirs.append(entry.path)
+                        continue
+                    try:
+                        # Follows symlinks, so --blob-store links report their blob's size
+                        st = entry.stat()
+                    except OSError:
+                        continue
+                    files.append((entry.path, st.st_size, st.st_mtime))
+        except OSError:
+            pass
+        return files, subdirs
 
-def save_metadata(metadata):
-    METADATA_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(METADATA_FILE, 'w') as f:
-        json.dump(metadata, f, indent=2)
+    def _walk(self, workers):
+        prefix = len(self.root) + 1
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="scan") as executor:
+            pending = {executor.submit(self._scan, self.root)}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    files, subdirs = future.result()
+                    for path, size, mtime in files:
+                        self.files[path[prefix:]] = (size, mtime)
+                    pending.update(executor.submit(self._scan, subdir) for subdir in subdirs)
+
+    def get(self, file_key):
+        """(size, mtime) of the file, or None if it did not exist."""
+        with self.lock:
+            return self.files.get(file_key)
+
+    def add(self, file_key, size, mtime):
+        with self.lock:
+            self.files[file_key] = (size, mtime)
+
+def get_files():
+    global _files
+    if _files is None:
+        _files = FileIndex()
+    return _files
+
+class ResponseCache:
+    """SQLite cache of API responses, separate from the state so it can be thrown away.
+
+    Task details are stored as their attachments array only, zlib-compressed,
+    and are valid for as long as the task's date_updated has not moved.
+    Writes are buffered like StateStore's. The workspace hierarchy is kept per
+    team and expires after HIERARCHY_TTL seconds.
+    """
+
+    def __init__(self, path=CACHE_DB):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.lock = threading.Lock()
+        # Other shards may hold the write lock for a moment
+        self.conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=OFF")
+        with self.conn:
+            self.conn.executescript(CACHE_SCHEMA)
+        self.pending = []
+        self.last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def task_attachments(self, task_id, date_updated):
+        """The cached attachments of a task as of `date_updated`, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT attachments FROM task_details WHERE task_id = ? AND date_updated = ?",
+                (task_id, date_updated)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(zlib.decompress(row[0]))
+
+    def store_task(self, task_id, date_updated, attachments):
+        slim = [{k: att[k] for k in ATTACHMENT_FIELDS if k in att} for att in attachments]
+        blob = zlib.compress(json.dumps(slim, separators=(",", ":")).encode())
+        with self.lock:
+            self.pending.append((task_id, date_updated, blob))
+            if (len(self.pending) >= STATE_FLUSH_EVERY
+                    or time.monotonic() - self.last_flush >= STATE_FLUSH_INTERVAL):
+                self._flush()
+
+    def hierarchy(self, team_id, max_age):
+        """(Hierarchy, fetched_at) cached for the team within `max_age` seconds, or None."""
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT tree, fetched_at FROM hierarchy WHERE team_id = ?", (team_id,)).fetchone()
+        if row is None or time.time() - row[1] > max_age:
+            return None
+        return Hierarchy.from_json(json.loads(zlib.decompress(row[0]))), row[1]
+
+    def store_hierarchy(self, team_id, hierarchy):
+        blob = zlib.compress(json.dumps(hierarchy.to_json(), separators=(",", ":")).encode())
+        with self.lock, self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO hierarchy (team_id, fetched_at, tree) VALUES (?, ?, ?)",
+                              (team_id, time.time(), blob))
+
+    def _flush(self):
+        if self.pending:
+            with self.conn:
+                self.conn.executemany(
+                    "INSERT OR REPLACE INTO task_details (task_id, date_updated, attachments) VALUES (?, ?, ?)",
+                    self.pending)
+            self.pending.clear()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        with self.lock:
+            if self.conn is None:
+                return
+            self._flush()
+            self.conn.close()
+            self.conn = None
+
+def get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            # Shared by every shard: entries are valid for anyone, and WAL lets processes write side by side
+            _cache = ResponseCache(CACHE_DB)
+            atexit.register(_cache.close)
+    return _cache
 
 def get_file_hash(file_path, chunk_size=8192):
     hash_obj = hashlib.md5()
@@ -47,238 +700,1493 @@ def get_file_hash(file_path, chunk_size=8192):
             hash_obj.update(chunk)
     return hash_obj.hexdigest()
 
-def is_duplicate(file_path, url, expected_size=None):
-    if not file_path.exists():
-        return False
-    
-    # Check file size if provided
-    if expected_size and file_path.stat().st_size != expected_size:
-        return False
-    
-    # Load metadata to check if this URL was already downloaded
-    metadata = load_metadata()
+def is_duplicate(file_path, url):
+    """Whether `url` was already downloaded to `file_path` and is still there, without touching the disk."""
     file_key = str(file_path.relative_to(OUT_DIR))
-    
-    if file_key in metadata:
-        stored_info = metadata[file_key]
-        # Check if same URL and file still exists with correct size
-        if (stored_info.get('url') == url and 
-            file_path.exists() and 
-            stored_info.get('size') == file_path.stat().st_size):
-            return True
-    
-    return False
+    stored_info = get_state().download_record(file_key)
+    if not stored_info or stored_info.get('url') != url:
+        return False
+    on_disk = get_files().get(file_key)
+    return on_disk is not None and on_disk[0] == stored_info.get('size')
 
-def record_download(file_path, url, size):
-    metadata = load_metadata()
-    file_key = str(file_path.relative_to(OUT_DIR))
-    metadata[file_key] = {
-        'url': url,
-        'size': size,
-        'downloaded_at': time.time()
-    }
-    save_metadata(metadata)
-
-def load_failed_downloads():
-    if FAILED_DOWNLOADS_FILE.exists():
-        try:
-            with open(FAILED_DOWNLOADS_FILE, 'r') as f:
-                return json.load(f)
-        except (json.JSONDecodeError, IOError):
-            return []
-    return []
-
-def log_failed_download(url, dest, error):
-    failed_downloads = load_failed_downloads()
-    failed_downloads.append({
-        'url': url,
-        'dest': str(dest.relative_to(OUT_DIR)),
-        'error': error,
-        'failed_at': time.time()
-    })
-    FAILED_DOWNLOADS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(FAILED_DOWNLOADS_FILE, 'w') as f:
-        json.dump(failed_downloads, f, indent=2)
+def record_download(file_path, url, size, sha256=None):
+    get_state().record_download(str(file_path.relative_to(OUT_DIR)), url, size, sha256)
+
+def log_failed_download(url, dest, error, retryable=True):
+    get_state().log_failure(url, str(dest.relative_to(OUT_DIR)), error, retryable)
 
 def load_processed_tasks():
-    if PROCESSED_TASKS_FILE.exists():
+    return get_state().processed_tasks()
+
+def mark_task_processed(task_id, date_updated=None):
+    get_state().mark_processed(task_id, date_updated)
+
+def task_updated(task):
+    return int(task.get("date_updated") or 0)
+
+def needs_processing(task, processed_tasks, incremental=False):
+    """A task is processed once, unless incremental mode sees it changed since."""
+    if task.id not in processed_tasks:
+        return True
+    # Tasks processed before date_updated was tracked (None) are revisited once
+    return incremental and task.date_updated > (processed_tasks[task.id] or 0)
+
+class RateLimiter:
+    """Token bucket for the ClickUp API, kept in sync with the X-RateLimit-* headers.
+
+    The bucket starts full so the per-minute quota is spent as fast as the server
+    allows; X-RateLimit-Remaining (less the requests still in flight) is taken as
+    the authoritative balance, and a 429 blocks every caller until `Retry-After`
+    (or the window reset) has passed.
+    """
+
+    def __init__(self, per_minute=API_RATE_LIMIT):
+        self.cond = threading.Condition()
+        self._set_limit(per_minute)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.reset_at = None
+        self.inflight = 0
+
+    def _set_limit(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+
+    def _refill(self, now):
+        if self.reset_at is not None and now >= self.reset_at:
+            self.tokens = float(self.capacity)
+            self.reset_at = None
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        with self.cond:
+            while True:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self.blocked_until - now
+                if wait <= 0:
+                    if self.tokens >= 1:
+                        self.tokens -= 1
+                        self.inflight += 1
+                        return
+                    wait = (1 - self.tokens) / self.rate
+                self.cond.wait(wait)
+
+    def update(self, response):
+        """Fold the rate-limit headers of an API `response` into the bucket."""
+        h = response.headers
+        now = time.monotonic()
+        with self.cond:
+            self.inflight = max(0, self.inflight - 1)
+            self._refill(now)
+            if h.get("X-RateLimit-Limit", "").isdigit():
+                self._set_limit(int(h["X-RateLimit-Limit"]))
+            reset = _header_float(h, "X-RateLimit-Reset")
+            if reset is not None:
+                # The reset header has one-second resolution; don't refill early
+                self.reset_at = now + max(0.0, reset - time.time()) + 1.0
+            remaining = _header_float(h, "X-RateLimit-Remaining")
+            if remaining is not None:
+                self.tokens = min(self.capacity, max(0.0, remaining - self.inflight))
+                if remaining <= 0 and self.reset_at is not None:
+                    self.blocked_until = max(self.blocked_until, self.reset_at)
+            if response.status_code == 429:
+                retry_after = _header_float(h, "Retry-After")
+                if retry_after is not None:
+                    until = now + retry_after
+                elif self.reset_at is not None:
+                    until = max(self.reset_at, now + 1.0)
+                else:
+                    until = now + 60.0
+                self.tokens = 0.0
+                self.blocked_until = max(self.blocked_until, until)
+            self.cond.notify_all()
+
+    def cancel(self):
+        """Release the slot of a request that never produced a response."""
+        with self.cond:
+            self.inflight = max(0, self.inflight - 1)
+
+def _header_float(headers, name):
+    try:
+        return float(headers[name])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+class CountingAdapter(HTTPAdapter):
+    """HTTPAdapter whose connection pools report every new connection to `client`."""
+
+    def __init__(self, client, **kwargs):
+        self.client = client
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        client = self.client
+
+        def counting(pool_cls):
+            class CountingPool(pool_cls):
+                def _new_conn(self):
+                    client.connection_opened()
+                    return super()._new_conn()
+            return CountingPool
+
+        # Copy rather than mutate: pool_classes_by_scheme is shared by every PoolManager
+        self.poolmanager.pool_classes_by_scheme = {
+            scheme: counting(cls) for scheme, cls in self.poolmanager.pool_classes_by_scheme.items()
+        }
+
+class AdaptiveConcurrency:
+    """AIMD concurrency window driven by response status and latency.
+
+    Every fast, successful response grows the window by 1/window (about +1 per
+    round of requests); a 429, a 5xx, a connection error or a smoothed latency
+    above `latency_factor` times the observed baseline (never less than
+    `latency_floor` seconds, so jitter on very fast responses is ignored) halves
+    it, at most once per cooldown so a burst of errors is one signal, not many.
+    """
+
+    def __init__(self, maximum, minimum=1, initial=4, latency_factor=2.0, latency_floor=0.05):
+        self.cond = threading.Condition()
+        self.maximum = max(minimum, maximum)
+        self.minimum = minimum
+        self.window = float(min(self.maximum, max(minimum, initial)))
+        self.latency_factor = latency_factor
+        self.latency_floor = latency_floor
+        self.inflight = 0
+        self.baseline = None
+        self.smoothed = None
+        self.last_decrease = 0.0
+
+    def acquire(self):
+        with self.cond:
+            while self.inflight >= int(self.window):
+                self.cond.wait()
+            self.inflight += 1
+
+    def release(self, latency=None, congested=False):
+        now = time.monotonic()
+        with self.cond:
+            self.inflight -= 1
+            if latency is not None:
+                # Baseline follows the fastest responses and only drifts up slowly
+                self.baseline = latency if self.baseline is None else min(
+                    latency, self.baseline + 0.01 * (latency - self.baseline))
+                self.smoothed = latency if self.smoothed is None else 0.8 * self.smoothed + 0.2 * latency
+                if self.smoothed > self.latency_factor * max(self.baseline, self.latency_floor):
+                    congested = True
+            if congested:
+                if now - self.last_decrease >= max(1.0, self.smoothed or 0.0):
+                    self.window = max(self.minimum, self.window / 2)
+                    self.last_decrease = now
+            elif latency is not None:
+                self.window = min(self.maximum, self.window + 1 / self.window)
+            self.cond.notify_all()
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def endpoint_name(url):
+    """API path with ids templated out (e.g. /list/{id}/task); anything else is an attachment."""
+    base = urlsplit(BASE)
+    parts = urlsplit(url)
+    if parts.netloc != base.netloc or not parts.path.startswith(base.path):
+        return "attachment"
+    segments = parts.path[len(base.path):].strip("/").split("/")
+    # ClickUp paths alternate collection and id: /team/{id}/space, /task/{id}, ...
+    return "/" + "/".join("{id}" if i % 2 else seg for i, seg in enumerate(segments))
+
+class Metrics:
+    """Per-endpoint request counts, latency histograms, bytes, retries and 429s,
+    plus the time spent writing downloads to disk.
+
+    Written as JSON and in the Prometheus text format to OUT_DIR at the end of a
+    run and every METRICS_INTERVAL seconds while it lasts.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.retries = {}
+        self.disk_writes = {'files': 0, 'bytes': 0, 'seconds': 0.0}
+        self.stop_event = None
+        self.thread = None
+
+    def _endpoint(self, name):
+        stats = self.endpoints.get(name)
+        if stats is None:
+            stats = self.endpoints[name] = {
+                'requests': 0, 'statuses': {}, 'rate_limited': 0, 'bytes': 0,
+                'latency_sum': 0.0, 'latency_buckets': [0] * (len(LATENCY_BUCKETS) + 1),
+            }
+        return stats
+
+    def observe(self, endpoint, latency, status="error", nbytes=0):
+        with self.lock:
+            stats = self._endpoint(endpoint)
+            stats['requests'] += 1
+            stats['statuses'][str(status)] = stats['statuses'].get(str(status), 0) + 1
+            if status == 429:
+                stats['rate_limited'] += 1
+            stats['bytes'] += nbytes
+            stats['latency_sum'] += latency
+            index = next((i for i, bound in enumerate(LATENCY_BUCKETS) if latency <= bound), len(LATENCY_BUCKETS))
+            stats['latency_buckets'][index] += 1
+
+    def disk_write(self, seconds, nbytes):
+        with self.lock:
+            self.disk_writes['files'] += 1
+            self.disk_writes['bytes'] += nbytes
+            self.disk_writes['seconds'] += seconds
+
+    def retry(self, policy, reason):
+        with self.lock:
+            key = (policy, reason)
+            self.retries[key] = self.retries.get(key, 0) + 1
+
+    def snapshot(self):
+        with self.lock:
+            return {
+                'generated_at': time.time(),
+                'latency_buckets': list(LATENCY_BUCKETS),
+                'endpoints': json.loads(json.dumps(self.endpoints)),
+                'retries': [{'policy': p, 'reason': r, 'count': n} for (p, r), n in sorted(self.retries.items())],
+                'disk_writes': dict(self.disk_writes),
+            }
+
+    def prometheus(self, snapshot):
+        lines = [
+            "# HELP clickup_requests_total Requests sent, by endpoint and HTTP status.",
+            "# TYPE clickup_requests_total counter",
+        ]
+        endpoints = sorted(snapshot['endpoints'].items())
+        for name, stats in endpoints:
+            for status, count in sorted(stats['statuses'].items()):
+                lines.append(f'clickup_requests_total{{endpoint="{name}",status="{status}"}} {count}')
+        lines += ["# HELP clickup_rate_limited_total 429 responses, by endpoint.",
+                  "# TYPE clickup_rate_limited_total counter"]
+        lines += [f'clickup_rate_limited_total{{endpoint="{name}"}} {stats["rate_limited"]}' for name, stats in endpoints]
+        lines += ["# HELP clickup_transferred_bytes_total Bytes received, by endpoint.",
+                  "# TYPE clickup_transferred_bytes_total counter"]
+        lines += [f'clickup_transferred_bytes_total{{endpoint="{name}"}} {stats["bytes"]}' for name, stats in endpoints]
+        lines += ["# HELP clickup_request_duration_seconds Request latency, by endpoint.",
+                  "# TYPE clickup_request_duration_seconds histogram"]
+        for name, stats in endpoints:
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), stats['latency_buckets']):
+                cumulative += count
+                lines.append(f'clickup_request_duration_seconds_bucket{{endpoint="{name}",le="{bound}"}} {cumulative}')
+            lines.append(f'clickup_request_duration_seconds_sum{{endpoint="{name}"}} {stats["latency_sum"]:.6f}')
+            lines.append(f'clickup_request_duration_seconds_count{{endpoint="{name}"}} {stats["requests"]}')
+        lines += ["# HELP clickup_retries_total Retried calls, by retry policy and error class.",
+                  "# TYPE clickup_retries_total counter"]
+        lines += [f'clickup_retries_total{{policy="{r["policy"]}",reason="{r["reason"]}"}} {r["count"]}'
+                  for r in snapshot['retries']]
+        disk = snapshot['disk_writes']
+        lines += ["# HELP clickup_disk_write_seconds_total Time spent writing and syncing downloads to disk.",
+                  "# TYPE clickup_disk_write_seconds_total counter",
+                  f"clickup_disk_write_seconds_total {disk['seconds']:.6f}",
+                  "# HELP clickup_disk_write_bytes_total Bytes of downloads written to disk.",
+                  "# TYPE clickup_disk_write_bytes_total counter",
+                  f"clickup_disk_write_bytes_total {disk['bytes']}",
+                  "# HELP clickup_disk_write_files_total Downloads written to disk.",
+                  "# TYPE clickup_disk_write_files_total counter",
+                  f"clickup_disk_write_files_total {disk['files']}"]
+        return "\n".join(lines) + "\n"
+
+    def write(self):
+        snapshot = self.snapshot()
+        OUT_DIR.mkdir(parents=True, exist_ok=True)
+        for path, text in ((shard_path(METRICS_JSON), json.dumps(snapshot, indent=2)),
+                           (shard_path(METRICS_PROM), self.prometheus(snapshot))):
+            # Write aside and rename so a scraper never reads half a file
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_text(text)
+            os.replace(tmp, path)
+
+    def start_periodic(self, interval=METRICS_INTERVAL):
+        self.stop_event = threading.Event()
+
+        def _loop(stop):
+            while not stop.wait(interval):
+                self.write()
+
+        self.thread = threading.Thread(target=_loop, args=(self.stop_event,), name="metrics", daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.stop_event is not None:
+            self.stop_event.set()
+            # A periodic write may be under way; both use the same .tmp files
+            self.thread.join()
+            self.stop_event = self.thread = None
+        self.write()
+
+METRICS = Metrics()
+
+class PhaseTimers:
+    """Time spent in each phase of a run, summed across the threads running it.
+
+    `wall` is the span from the first entry to the last exit, so a phase spread
+    over eight workers shows about eight times more busy time than wall time.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.phases = {}
+
+    @contextmanager
+    def time(self, phase):
+        started = time.perf_counter()
         try:
-            with open(PROCESSED_TASKS_FILE, 'r') as f:
-                return set(json.load(f))
-        except (json.JSONDecodeError, IOError):
-            return set()
-    return set()
+            yield
+        finally:
+            ended = time.perf_counter()
+            with self.lock:
+                stats = self.phases.setdefault(phase, {'calls': 0, 'busy': 0.0, 'first': started, 'last': ended})
+                stats['calls'] += 1
+                stats['busy'] += ended - started
+                stats['first'] = min(stats['first'], started)
+                stats['last'] = max(stats['last'], ended)
 
-def mark_task_processed(task_id):
-    processed_tasks = load_processed_tasks()
-    processed_tasks.add(task_id)
-    PROCESSED_TASKS_FILE.parent.mkdir(parents=True, exist_ok=True)
-    with open(PROCESSED_TASKS_FILE, 'w') as f:
-        json.dump(list(processed_tasks), f, indent=2)
+    def summary(self):
+        with self.lock:
+            return [(phase, s['calls'], s['busy'], s['last'] - s['first'])
+                    for phase, s in self.phases.items()]
 
-def api_get(url, **params):
-    r = requests.get(url, headers=HEAD, params=params)
+PHASES = PhaseTimers()
+
+class Profiler:
+    """cProfile over every thread of the run; on its own cProfile only sees the thread that enabled it.
+
+    From Python 3.12 cProfile hooks into sys.monitoring, which is process-wide and
+    keeps a single call stack, so events from concurrent threads would be mixed
+    into nonsense. There only the main thread is profiled, with the pure-Python
+    profile module (its hook is per thread), at a higher overhead.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.profiles = []
+
+    def _enable_in_thread(self, frame, event, arg):
+        sys.setprofile(None)
+        profile = cProfile.Profile()
+        profile.enable()
+        with self.lock:
+            self.profiles.append(profile)
+
+    def run(self, path, func, *args):
+        """Call `func(*args)` under the profiler and dump the merged stats to `path`."""
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._enable_in_thread)
+            profile = cProfile.Profile()
+        else:
+            report("[yellow]Python 3.12+: profiling the main thread only, worker threads are not covered[/yellow]",
+                   "warning", message="profiling the main thread only on Python 3.12+")
+            profile = pyprofile.Profile()
+        self.profiles.append(profile)
+        try:
+            return profile.runcall(func, *args)
+        finally:
+            threading.setprofile(None)
+            with self.lock:
+                stats = pstats.Stats(*self.profiles)
+            stats.dump_stats(path)
+
+class HostBudget:
+    """Adaptive concurrency window and optional rate limiter shared by one class of hosts."""
+
+    def __init__(self, name, concurrency, limiter=None):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.control = AdaptiveConcurrency(self.concurrency)
+        self.limiter = limiter
+
+    @property
+    def window(self):
+        return int(self.control.window)
+
+    def acquire(self):
+        self.control.acquire()
+
+    def release(self, response=None):
+        """Feed the outcome back into the window; no `response` means the request failed."""
+        if response is None:
+            self.control.release(congested=True)
+        else:
+            congested = response.status_code == 429 or response.status_code >= 500
+            self.control.release(response.elapsed.total_seconds(), congested)
+
+class Client:
+    """Persistent per-host HTTP sessions that every API call and download goes through.
+
+    Requests are classified by host: calls to the API host spend the API budget
+    (bounded concurrency plus the header-driven rate limiter), everything else is
+    attachment CDN traffic with its own, by default unmetered, budget.
+    """
+
+    def __init__(self, budgets):
+        self.budgets = budgets
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.requests_sent = 0
+        self.connections_opened = 0
+
+    def host_class(self, url):
+        return "api" if urlsplit(url).netloc == urlsplit(BASE).netloc else "cdn"
+
+    def session(self, url, budget):
+        host = urlsplit(url).netloc
+        with self.lock:
+            session = self.sessions.get(host)
+            if session is None:
+                session = requests.Session()
+                adapter = CountingAdapter(self, pool_connections=1, pool_maxsize=budget.concurrency)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self.sessions[host] = session
+            return session
+
+    def _send(self, budget, url, **kwargs):
+        session = self.session(url, budget)
+        if budget.limiter:
+            budget.limiter.acquire()
+        with self.lock:
+            self.requests_sent += 1
+        try:
+            r = session.get(url, **kwargs)
+        except BaseException:
+            if budget.limiter:
+                budget.limiter.cancel()
+            raise
+        if budget.limiter:
+            budget.limiter.update(r)
+        return r
+
+    def get(self, url, **kwargs):
+        budget = self.budgets[self.host_class(url)]
+        budget.acquire()
+        started = time.perf_counter()
+        r = None
+        try:
+            r = self._send(budget, url, **kwargs)
+            return r
+        finally:
+            budget.release(r)
+            METRICS.observe(endpoint_name(url), time.perf_counter() - started,
+                            r.status_code if r is not None else "error",
+                            len(r.content) if r is not None else 0)
+
+    @contextmanager
+    def stream(self, url, **kwargs):
+        """Streaming GET that holds its host-class slot until the body is consumed."""
+        budget = self.budgets[self.host_class(url)]
+        budget.acquire()
+        started = time.perf_counter()
+        r = None
+        try:
+            r = self._send(budget, url, stream=True, **kwargs)
+            yield r
+        finally:
+            received = r.raw.tell() if r is not None else 0
+            if r is not None:
+                r.close()
+            budget.release(r)
+            METRICS.observe(endpoint_name(url), time.perf_counter() - started,
+                            r.status_code if r is not None else "error", received)
+
+    def connection_opened(self):
+        with self.lock:
+            self.connections_opened += 1
+
+    @property
+    def connections_reused(self):
+        return max(0, self.requests_sent - self.connections_opened)
+
+    def close(self):
+        with self.lock:
+            for session in self.sessions.values():
+                session.close()
+            self.sessions.clear()
+
+class VerificationError(Exception):
+    """A downloaded file does not match the size or checksum the server announced."""
+
+class RetryPolicy:
+    """Exponential backoff with full jitter and a separate attempt budget per error class.
+
+    `Retry-After` on a failed response overrides the computed delay.
+    """
+
+    def __init__(self, name, limits, base=0.5, cap=30.0):
+        self.name = name
+        self.limits = limits
+        self.base = base
+        self.cap = cap
+
+    @staticmethod
+    def classify(exc):
+        if isinstance(exc, VerificationError):
+            return "verification"
+        if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+            status = exc.response.status_code
+            if status == 429:
+                return "rate_limited"
+            return "server" if status >= 500 else None
+        if isinstance(exc, requests.exceptions.Timeout):
+            return "timeout"
+        if isinstance(exc, (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError)):
+            return "connection"
+        return None
+
+    def delay(self, attempt, exc):
+        response = getattr(exc, "response", None)
+        if response is not None:
+            retry_after = _header_float(response.headers, "Retry-After")
+            if retry_after is not None:
+                return retry_after
+        return random.uniform(0, min(self.cap, self.base * 2 ** attempt))
+
+    def call(self, fn, *args, **kwargs):
+        attempts = {}
+        while True:
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                kind = self.classify(e)
+                if kind is None or attempts.get(kind, 0) >= self.limits.get(kind, 0):
+                    raise
+                attempts[kind] = attempts.get(kind, 0) + 1
+                METRICS.retry(self.name, kind)
+                time.sleep(self.delay(sum(attempts.values()) - 1, e))
+
+API_RETRY = RetryPolicy("api", {"connection": 5, "timeout": 4, "server": 4, "rate_limited": 6})
+DOWNLOAD_RETRY = RetryPolicy("download", {"connection": 5, "timeout": 4, "server": 4, "rate_limited": 6, "verification": 2})
+
+API_LIMITER = RateLimiter()
+CLIENT = Client({
+    "api": HostBudget("api", API_CONCURRENCY, API_LIMITER),
+    "cdn": HostBudget("cdn", CDN_CONCURRENCY, RateLimiter(CDN_RATE_LIMIT) if CDN_RATE_LIMIT else None),
+})
+
+def _api_get_once(url, params):
+    r = CLIENT.get(url, headers=HEAD, params=params, timeout=30)
     r.raise_for_status()
     return r.json()
 
+def api_get(url, **params):
+    return API_RETRY.call(_api_get_once, url, params)
+
 def get_spaces():
     data = api_get(f"{BASE}/team/{TEAM}/space")["spaces"]
     return {s["id"]: s["name"] for s in data}
 
-def get_folder_lists(space_id):
-    lists = []
+@dataclass
+class TaskRef:
+    """The part of a listed task the pipeline needs; the rest of its JSON is dropped on arrival."""
+    __slots__ = ("id", "date_updated", "list_id")
+    id: str
+    date_updated: int
+    list_id: str
+
+    @classmethod
+    def from_json(cls, task, list_id):
+        return cls(task["id"], task_updated(task), list_id)
+
+@dataclass
+class TaskList:
+    id: str
+    name: str
+
+@dataclass
+class Folder:
+    id: Optional[str]           # None holds the space's folder-less lists
+    name: Optional[str]
+    lists: list = field(default_factory=list)
+
+@dataclass
+class Space:
+    id: str
+    name: str
+    folders: list = field(default_factory=list)
+
+@dataclass
+class Hierarchy:
+    """Workspace tree: space → folder → list."""
+    spaces: list = field(default_factory=list)
+    complete: bool = True       # False when some space could not be listed
+
+    def to_json(self):
+        return asdict(self)['spaces']
+
+    @classmethod
+    def from_json(cls, spaces):
+        return cls([
+            Space(space['id'], space['name'], [
+                Folder(folder['id'], folder['name'], [TaskList(**lst) for lst in folder['lists']])
+                for folder in space['folders']])
+            for space in spaces])
+
+    def lists(self):
+        for space in self.spaces:
+            for folder in space.folders:
+                for lst in folder.lists:
+                    yield space, folder, lst
+
+    def shard(self, index, count):
+        """The part of the tree whose output directories hash into shard `index` of `count`.
+
+        Lists are split by the directory they write into (space/list name), not by
+        id, so same-named lists from different folders stay in one shard.
+        """
+        return Hierarchy([
+            Space(space.id, space.name, [
+                Folder(folder.id, folder.name,
+                       [lst for lst in folder.lists if shard_of(f"{space.name}/{lst.name}", count) == index])
+                for folder in space.folders])
+            for space in self.spaces], self.complete)
+
+def shard_of(key, count):
+    # A stable hash, unlike hash(), so every machine agrees on the split
+    return int.from_bytes(hashlib.sha1(str(key).encode()).digest()[:8], "big") % count
+
+def get_space(space_id, name):
+    space = Space(space_id, name)
     # ① folder‑less lists
-    lists += api_get(f"{BASE}/space/{space_id}/list").get("lists", [])
+    loose = api_get(f"{BASE}/space/{space_id}/list").get("lists", [])
+    space.folders.append(Folder(None, None, [TaskList(l["id"], l["name"]) for l in loose]))
     # ② lists inside folders
     for f in api_get(f"{BASE}/space/{space_id}/folder").get("folders", []):
-        lists += f.get("lists", [])
-    return lists
+        space.folders.append(Folder(f["id"], f.get("name"),
+                                    [TaskList(l["id"], l["name"]) for l in f.get("lists", [])]))
+    return space
 
-def iter_tasks(list_id):
+def discover_hierarchy(workers=API_WORKERS):
+    """Fetch every space's folders and lists concurrently, within the shared rate limit."""
+    spaces = get_spaces()
+    hierarchy = Hierarchy()
+    with ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix="hierarchy") as executor:
+        futures = [(sname, executor.submit(get_space, sid, sname)) for sid, sname in spaces.items()]
+        for sname, future in futures:
+            try:
+                hierarchy.spaces.append(future.result())
+            except Exception as e:
+                report(f"[red]  Error listing space {sname}: {str(e)}[/red]", "error", space=sname, error=str(e))
+                hierarchy.complete = False
+    return hierarchy
+
+def iter_tasks(list_id, updated_after=None):
+    params = {"include_closed": "true"}
+    if updated_after is not None:
+        params["date_updated_gt"] = updated_after
     page = 0
     while True:
-        data = api_get(f"{BASE}/list/{list_id}/task",
-                       page=page, include_closed="true")
-        yield from data.get("tasks", [])
-        if data.get("last_page", True): break
+        with PHASES.time("task enumeration"):
+            data = api_get(f"{BASE}/list/{list_id}/task", page=page, **params)
+        # Reduce the page before yielding: the consumer may block on a full queue, and the
+        # descriptions, custom fields etc. should not be held while it waits
+        refs = [TaskRef.from_json(task, list_id) for task in data.get("tasks", [])]
+        last_page = data.get("last_page", True)
+        del data
+        yield from refs
+        if last_page: break
         page += 1
-        time.sleep(RATE_DELAY)
 
-def download(url, dest):
-    dest.parent.mkdir(parents=True, exist_ok=True)
+def blob_path(sha256):
+    return BLOB_DIR / sha256[:2] / sha256
+
+def store_blob(staged, sha256):
+    """Move a freshly downloaded file into the blob store, keeping any existing copy."""
+    blob = blob_path(sha256)
+    if blob.exists():
+        staged.unlink()
+    else:
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, blob)
+    return blob
+
+def link_blob(blob, dest):
+    """Point `dest` at `blob`: a hardlink where possible, else a relative symlink."""
+    if dest.is_symlink() or dest.exists():
+        dest.unlink()
     try:
-        with requests.get(url, stream=True, headers=HEAD, timeout=30) as r:
-            r.raise_for_status()
+        os.link(blob, dest)
+    except OSError:
+        dest.symlink_to(os.path.relpath(blob, dest.parent))
+
+def _content_range(response):
+    """Parse `Content-Range: bytes start-end/total` into (start, total); total may be None."""
+    value = response.headers.get("Content-Range", "")
+    try:
+        unit, rest = value.split(" ", 1)
+        span, total = rest.split("/", 1)
+        start = int(span.split("-", 1)[0])
+        return (start, None if total == "*" else int(total)) if unit == "bytes" else (None, None)
+    except ValueError:
+        return None, None
+
+def _validator(response):
+    """Strong ETag or Last-Modified, usable in If-Range; weak ETags can't validate ranges."""
+    etag = response.headers.get("ETag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return response.headers.get("Last-Modified")
+
+def is_retryable(exc):
+    """Whether a failed download is worth attempting again later."""
+    if isinstance(exc, requests.exceptions.HTTPError) and exc.response is not None:
+        return exc.response.status_code == 429 or exc.response.status_code >= 500
+    return isinstance(exc, (requests.exceptions.RequestException, VerificationError))
+
+_MD5_ETAG = re.compile(r'^"?([0-9a-fA-F]{32})"?$')
+
+def _expected_md5(response):
+    """MD5 announced by Content-MD5, or by a single-part S3-style ETag."""
+    content_md5 = response.headers.get("Content-MD5")
+    if content_md5:
+        try:
+            return base64.b64decode(content_md5).hex()
+        except ValueError:
+            return None
+    match = _MD5_ETAG.match(response.headers.get("ETag", ""))
+    if match and not response.headers.get("Content-Encoding"):
+        return match.group(1).lower()
+    return None
+
+def _discard_part(part, key):
+    if part.exists():
+        part.unlink()
+    get_state().clear_partial(key)
+
+def _stream_to_part(url, part, key):
+    """One pass of streaming `url` into `part`, resuming from its current length.
+
+    Returns (sha256, md5, total, expected_md5), or None when the part file had to
+    be discarded and the caller should start again from byte zero.
+    """
+    partial = get_state().partial(key)
+    offset = part.stat().st_size if part.exists() else 0
+    # Sizes and ranges below count bytes on the wire, so ask for them unencoded
+    headers = dict(HEAD)
+    headers['Accept-Encoding'] = 'identity'
+    if offset and partial and partial['url'] == url and partial['validator']:
+        headers['Range'] = f"bytes={offset}-"
+        headers['If-Range'] = partial['validator']
+    else:
+        offset = 0
+
+    with CLIENT.stream(url, headers=headers, timeout=30) as r:
+        if r.status_code == 416:
+            # Our offset is past the end of what the server has: start over
+            _discard_part(part, key)
+            return None
+        r.raise_for_status()
+        
+        start, total = _content_range(r) if r.status_code == 206 else (None, None)
+        resumed = offset and start == offset and (
+            partial['size'] is None or total is None or total == partial['size'])
+        if not resumed:
+            if r.status_code == 206:
+                # A range we didn't ask for, or the file changed size: fetch it whole
+                _discard_part(part, key)
+                return None
+            offset = 0
             content_length = r.headers.get('content-length')
-            expected_size = int(content_length) if content_length else None
-            
-            with open(dest, "wb") as f:
-                for chunk in r.iter_content(8192):
-                    f.write(chunk)
-            
-            # Record the download in metadata
-            actual_size = dest.stat().st_size
-            record_download(dest, url, actual_size)
-            return True
+            total = int(content_length) if content_length else None
+        # Encoded anyway: the part file holds decoded bytes, which neither the
+        # length nor a later Range request can be checked against
+        encoded = r.headers.get('Content-Encoding', 'identity').lower() != 'identity'
+        if encoded:
+            total = None
+        get_state().set_partial(key, url, None if encoded else _validator(r), total)
+        
+        # Hash while streaming so the blob store never re-reads the file;
+        # on resume only the bytes already on disk are read back once
+        digest, md5 = hashlib.sha256(), hashlib.md5()
+        if resumed:
+            with open(part, "rb") as f:
+                while chunk := f.read(1 << 20):
+                    digest.update(chunk)
+                    md5.update(chunk)
+        writing = 0.0
+        with open(part, "ab" if resumed else "wb") as f:
+            for chunk in r.iter_content(8192):
+                digest.update(chunk)
+                md5.update(chunk)
+                started = time.perf_counter()
+                f.write(chunk)
+                writing += time.perf_counter() - started
+            started = time.perf_counter()
+            f.flush()
+            os.fsync(f.fileno())
+            writing += time.perf_counter() - started
+        METRICS.disk_write(writing, part.stat().st_size - offset)
+        return digest, md5, total, _expected_md5(r)
+
+def _fetch_to_part(url, part, key):
+    """Stream `url` into `part`, resuming from its current length when the server allows.
+
+    The finished part file is checked against the announced size and MD5 (if any)
+    and synced to disk. Returns its SHA-256; raises VerificationError on a mismatch.
+    """
+    result = _stream_to_part(url, part, key)
+    if result is None:
+        result = _stream_to_part(url, part, key)
+    if result is None:
+        # Even a fresh fetch came back as a range we can't use
+        raise VerificationError("server did not send the whole file on a restart")
+    digest, md5, total, expected_md5 = result
+    
+    size = part.stat().st_size
+    problem = None
+    if total is not None and size != total:
+        problem = f"expected {total} bytes, got {size}"
+    elif expected_md5 and md5.hexdigest() != expected_md5:
+        problem = f"MD5 {md5.hexdigest()} does not match {expected_md5}"
+    if problem:
+        # Never let a corrupt file reach its final path; the next attempt starts over
+        _discard_part(part, key)
+        raise VerificationError(problem)
+    return digest.hexdigest()
+
+def download(url, dest, blob_store=False):
+    with PHASES.time("downloads"):
+        return _download(url, dest, blob_store)
+
+def _download(url, dest, blob_store):
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    part = dest.with_name(dest.name + ".part")
+    key = str(dest.relative_to(OUT_DIR))
+    try:
+        sha256 = DOWNLOAD_RETRY.call(_fetch_to_part, url, part, key)
+        if blob_store:
+            link_blob(store_blob(part, sha256), dest)
+        else:
+            os.replace(part, dest)
+        get_state().clear_partial(key)
+        
+        # Record the download in metadata
+        st = dest.stat()
+        record_download(dest, url, st.st_size, sha256)
+        get_files().add(key, st.st_size, st.st_mtime)
+        get_state().clear_failures(key)
+        return True
             
-    except requests.exceptions.RequestException as e:
-        # Log the failed download
-        log_failed_download(url, dest, str(e))
-        # Clean up partial file if it exists
-        if dest.exists():
-            dest.unlink()
+    except VerificationError as e:
+        log_failed_download(url, dest, str(e), retryable=True)
+        return False
+    
+    except (requests.exceptions.RequestException, OSError) as e:
+        # Log the failed download; the .part file stays behind so the next attempt can resume
+        log_failed_download(url, dest, str(e), retryable=is_retryable(e))
+        partial = get_state().partial(key)
+        if part.exists() and not (partial and partial['validator']):
+            part.unlink()
         return False
 
-def main():
-    # Create output directory
-    OUT_DIR.mkdir(exist_ok=True)
+class DownloadPool:
+    """Bounded pool of download workers fed attachment jobs by the task walker.
+
+    A task is only marked processed once every attachment submitted for it has
+    finished, so an interrupted run never loses images that were still queued.
+    """
+
+    def __init__(self, workers=DOWNLOAD_WORKERS, blob_store=False):
+        self.workers = max(1, workers)
+        self.blob_store = blob_store
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download")
+        # Cap queued jobs so the walker cannot run arbitrarily far ahead of the disk
+        self.slots = threading.BoundedSemaphore(self.workers * 4)
+        self.lock = threading.Lock()
+        self.inflight = {}          # dest -> future, so two jobs never write the same file
+        self.downloaded = 0
+        self.failed = 0
+
+    def submit(self, url, dest):
+        with self.lock:
+            if dest in self.inflight:
+                return self.inflight[dest]
+        self.slots.acquire()
+        try:
+            future = self.executor.submit(download, url, dest, self.blob_store)
+        except BaseException:
+            self.slots.release()
+            raise
+        with self.lock:
+            self.inflight[dest] = future
+        future.add_done_callback(lambda f: self._finished(f, url, dest))
+        return future
+
+    def _finished(self, future, url, dest):
+        self.slots.release()
+        ok = not future.cancelled() and future.exception() is None and future.result()
+        with self.lock:
+            self.inflight.pop(dest, None)
+            if ok:
+                self.downloaded += 1
+            else:
+                self.failed += 1
+        if not ok:
+            report(f"[red]  Failed to download: {dest.name}[/red]", "download_failed", path=str(dest), url=url)
+
+    def when_done(self, futures, callback):
+        """Call `callback()` once every future in `futures` has completed."""
+        if not futures:
+            callback()
+            return
+        pending = [len(futures)]
+        lock = threading.Lock()
+
+        def _one_done(_):
+            with lock:
+                pending[0] -= 1
+                last = pending[0] == 0
+            if last:
+                callback()
+
+        for future in futures:
+            future.add_done_callback(_one_done)
+
+    def finish_task(self, task_id, futures, date_updated=None):
+        """Mark `task_id` processed once all of its `futures` have completed.
+
+        Returns a future that resolves after the task has been marked.
+        """
+        marked = Future()
+
+        def _mark():
+            mark_task_processed(task_id, date_updated)
+            marked.set_result(task_id)
+
+        self.when_done(futures, _mark)
+        return marked
+
+    def close(self):
+        self.executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ListRun:
+    """Tracks one list while its tasks flow through the pipeline.
+
+    The list's watermark is only advanced once enumeration has finished, every
+    task handed to the detail workers has been marked processed, and none failed.
+    It never goes past the moment enumeration began (less WATERMARK_OVERLAP_MS):
+    a task edited while later pages were being read may already have been
+    listed with its old date_updated. Nor does it pass a task that was skipped
+    although it changed since it was processed, so --incremental still finds it.
+    """
+
+    def __init__(self, list_id, sname, lname, commit=True):
+        self.list_id = list_id
+        self.sname = sname
+        self.lname = lname
+        self.commit = commit
+        self.lock = threading.Lock()
+        self.high_water = None
+        self.ceiling = None         # just below the oldest changed task that was skipped
+        self.outstanding = 0
+        self.errors = 0
+        self.enumerated = False
+        self.started_ms = int(time.time() * 1000)
+
+    def seen(self, task, queued, stale=False):
+        with self.lock:
+            self.high_water = max(self.high_water or 0, task.date_updated)
+            if queued:
+                self.outstanding += 1
+            elif stale:
+                self.ceiling = min(task.date_updated - 1, self.ceiling if self.ceiling is not None else task.date_updated)
+
+    def task_done(self, ok=True):
+        with self.lock:
+            self.outstanding -= 1
+            if not ok:
+                self.errors += 1
+        self._maybe_commit()
+
+    def close(self, ok=True):
+        with self.lock:
+            self.enumerated = True
+            if not ok:
+                self.errors += 1
+        self._maybe_commit()
+
+    def _maybe_commit(self):
+        with self.lock:
+            if not self.commit or not self.enumerated or self.outstanding or self.errors or self.high_water is None:
+                return
+            value = min(self.high_water, self.started_ms - WATERMARK_OVERLAP_MS)
+            if self.ceiling is not None:
+                value = min(value, self.ceiling)
+            self.high_water = None
+        get_state().set_watermark(self.list_id, value)
+
+def image_attachments(tdata, run):
+    """(attachment, destination path) for each image attached to a task's details."""
+    for att in tdata.get("attachments", []):
+        if att.get("mimetype", "").startswith("image/"):
+            fname = att.get("title") or att.get("filename")
+            file_key = str(pathlib.Path(run.sname, run.lname, fname))
+            if att.get("id"):
+                file_key = get_state().attachment_path(att["id"], file_key, att["url"])
+            yield att, OUT_DIR / file_key
+
+class TaskPipeline:
+    """Streams tasks from enumeration through detail fetches into the download pool.
+
+    The stages are connected by bounded queues, so downloads start as soon as the
+    first page of tasks arrives and memory stays flat however large the workspace.
+    """
+
+    commits_watermarks = True
+
+    def __init__(self, hierarchy, processed_tasks, pool, progress, incremental=False):
+        self.hierarchy = hierarchy
+        self.processed_tasks = processed_tasks
+        self.pool = pool
+        self.progress = progress
+        self.incremental = incremental
+        self.tasks = queue.Queue(maxsize=TASK_QUEUE_SIZE)
+        self.lock = threading.Lock()
+        self.total_tasks = 0
+        self.remaining_tasks = 0
+        self.task_bar = progress.add_task("[cyan]Processing tasks (enumerating...)", total=0, windows=True, name="tasks")
+        self.image_bar = progress.add_task("[cyan]Downloading images", total=0, name="images")
+        self.images_total = 0
+
+    def run(self):
+        workers = [threading.Thread(target=self._detail_worker, name=f"details-{i}", daemon=True)
+                   for i in range(API_WORKERS)]
+        for worker in workers:
+            worker.start()
+        try:
+            self._enumerate()
+        finally:
+            for _ in workers:
+                self.tasks.put(None)
+            for worker in workers:
+                worker.join()
+        self.progress.update(self.task_bar, description="[cyan]Processing tasks")
+
+    def _enumerate(self):
+        for space, folder, lst in self.hierarchy.lists():
+            sname = space.name
+            run = ListRun(lst.id, sname, lst.name, commit=self.commits_watermarks)
+            watermark = get_state().watermark(lst.id) if self.incremental else None
+            try:
+                for task in iter_tasks(lst.id, updated_after=watermark):
+                    queued = needs_processing(task, self.processed_tasks, self.incremental)
+                    # Skipped although edited since it was processed (a run without --incremental)
+                    stale = not queued and task.date_updated > (self.processed_tasks.get(task.id) or 0)
+                    run.seen(task, queued, stale)
+                    with self.lock:
+                        self.total_tasks += 1
+                        self.remaining_tasks += queued
+                    if queued:
+                        self.progress.update(self.task_bar, total=self.remaining_tasks)
+                        self.tasks.put((run, task))
+            except Exception as e:
+                report(f"[red]  Error listing tasks of {sname}/{lst.name}: {str(e)}[/red]",
+                       "error", space=sname, list=lst.name, error=str(e))
+                run.close(ok=False)
+                continue
+            run.close()
+
+    def _detail_worker(self):
+        while True:
+            item = self.tasks.get()
+            if item is None:
+                return
+            run, task = item
+            self.progress.update(self.task_bar, advance=1)
+            try:
+                futures = self._process(run, task)
+            except Exception as e:
+                report(f"[red]  Error processing task {task.id}: {str(e)}[/red]", "error", task=task.id, error=str(e))
+                run.task_done(ok=False)
+                continue
+            self._finish(run, task, futures)
+
+    def _finish(self, run, task, futures):
+        marked = self.pool.finish_task(task.id, futures, task.date_updated)
+        marked.add_done_callback(lambda _, run=run: run.task_done())
+
+    def _details(self, task):
+        # Without a date_updated there is nothing to tell a stale entry from a fresh one
+        if task.date_updated:
+            attachments = get_cache().task_attachments(task.id, task.date_updated)
+            if attachments is not None:
+                return {"attachments": attachments}
+        with PHASES.time("task details"):
+            tdata = api_get(f"{BASE}/task/{task.id}")
+        if task.date_updated:
+            get_cache().store_task(task.id, task.date_updated, tdata.get("attachments", []))
+        return tdata
+
+    def _process(self, run, task):
+        futures = []
+        for att, path in image_attachments(self._details(task), run):
+            # Check for duplicates using improved method
+            with PHASES.time("duplicate checks"):
+                duplicate = is_duplicate(path, att["url"])
+            if not duplicate:
+                report(f"[dim]  Downloading: {path.name}[/dim]")
+                with self.lock:
+                    self.images_total += 1
+                    self.progress.update(self.image_bar, total=self.images_total)
+                future = self.pool.submit(att["url"], path)
+                future.add_done_callback(lambda _: self.progress.update(self.image_bar, advance=1))
+                futures.append(future)
+            else:
+                report(f"[dim]  Skipping duplicate: {path.name}[/dim]")
+        return futures
+
+class PlanPipeline(TaskPipeline):
+    """TaskPipeline that writes each image attachment to a JSON-lines manifest instead of downloading it.
+
+    Planning leaves processed tasks and list watermarks alone, so it can be rerun freely.
+    """
+
+    commits_watermarks = False
+
+    def __init__(self, hierarchy, processed_tasks, manifest, progress, incremental=False):
+        super().__init__(hierarchy, processed_tasks, None, progress, incremental)
+        self.manifest = manifest
+        self.planned = 0
+        self.progress.update(self.image_bar, description="[cyan]Planning images")
+
+    def _finish(self, run, task, futures):
+        run.task_done()
+
+    def _process(self, run, task):
+        lines = [json.dumps({
+            'task_id': task.id, 'attachment_id': att.get("id"), 'url': att["url"], 'size': att.get("size"),
+            'mimetype': att.get("mimetype"), 'path': str(path.relative_to(OUT_DIR)),
+        }) for att, path in image_attachments(self._details(task), run)]
+        with self.lock:
+            # A task's attachments stay on consecutive lines
+            self.manifest.writelines(line + "\n" for line in lines)
+            self.planned += len(lines)
+            self.progress.update(self.image_bar, total=self.planned, completed=self.planned)
+        return []
+
+def read_manifest(path, part=slice(None)):
+    """Stream the manifest entries selected by `part`, a slice over its lines."""
+    with open(path) as f:
+        for line in itertools.islice((line for line in f if line.strip()), part.start, part.stop, part.step):
+            yield json.loads(line)
+
+class ConcurrencyColumn(ProgressColumn):
+    """Current adaptive window per host class, shown on rows created with windows=True."""
+
+    def render(self, task):
+        if not task.fields.get("windows"):
+            return Text("")
+        return Text(" ".join(f"{b.name}×{b.window}" for b in CLIENT.budgets.values()), style="magenta")
+
+class HeadlessProgress:
+    """Stand-in for rich's Progress that emits a `progress` event every PROGRESS_INTERVAL seconds.
+
+    Updates only touch counters, so per-file bookkeeping costs next to nothing
+    however many files go by; rows are named by their `name` field.
+    """
+
+    @dataclass
+    class Row:
+        name: str
+        total: Optional[int] = 0
+        completed: int = 0
+
+    def __init__(self, interval=PROGRESS_INTERVAL):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.tasks = []
+        self.started = time.monotonic()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self._loop, name="progress", daemon=True)
+
+    def add_task(self, description, total=0, name=None, **fields):
+        with self.lock:
+            self.tasks.append(self.Row(name or description, total))
+            return len(self.tasks) - 1
+
+    def update(self, task_id, advance=None, total=None, completed=None, **fields):
+        with self.lock:
+            row = self.tasks[task_id]
+            if total is not None:
+                row.total = total
+            if completed is not None:
+                row.completed = completed
+            if advance:
+                row.completed += advance
+
+    def emit(self):
+        with self.lock:
+            rows = {row.name: {'completed': row.completed, 'total': row.total} for row in self.tasks}
+        EVENTS.emit("progress", elapsed=round(time.monotonic() - self.started, 1), **rows,
+                    windows={b.name: b.window for b in CLIENT.budgets.values()})
+
+    def _loop(self):
+        while not self.stopped.wait(self.interval):
+            self.emit()
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stopped.set()
+        self.thread.join()
+        self.emit()
+
+def make_progress():
+    if EVENTS is not None:
+        return HeadlessProgress()
+    return Progress(
+        SpinnerColumn(),
+        TextColumn("[progress.description]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TaskProgressColumn(),
+        TimeElapsedColumn(),
+        ConcurrencyColumn(),
+        console=console,
+        expand=True
+    )
+
+def discover_workspace(refresh=False):
+    """The hierarchy this run covers (only the --shard's lists when sharding), announced on the console.
+
+    A tree cached within HIERARCHY_TTL is reused unless `refresh` is set. The whole
+    tree is cached, unsharded, and the shard's lists are picked from it afterwards,
+    so one fetch serves the canonical run and every shard.
+    """
+    cached = get_cache().hierarchy(TEAM, HIERARCHY_TTL) if HIERARCHY_TTL > 0 and not refresh else None
+    if cached:
+        hierarchy, fetched_at = cached
+        age = time.time() - fetched_at
+        report(f"[green]✓[/green] Using the workspace hierarchy cached {age / 60:.0f} min ago "
+               "(--refresh-hierarchy to fetch it again)", "hierarchy_cached", age=round(age, 1))
+    else:
+        status = console.status("[bold green]Discovering spaces, folders and lists...") if EVENTS is None else nullcontext()
+        with status, PHASES.time("hierarchy discovery"):
+            hierarchy = discover_hierarchy()
+        # A tree with missing spaces would hide their lists until it expired
+        if hierarchy.complete:
+            get_cache().store_hierarchy(TEAM, hierarchy)
+    if SHARD:
+        hierarchy = hierarchy.shard(*SHARD)
     
+    folder_count = sum(1 for space in hierarchy.spaces for folder in space.folders if folder.id is not None)
+    list_count = sum(1 for _ in hierarchy.lists())
+    report(f"[green]✓[/green] Found {len(hierarchy.spaces)} space(s), {folder_count} folder(s), {list_count} list(s)",
+           "hierarchy", spaces=len(hierarchy.spaces), folders=folder_count, lists=list_count)
+    return hierarchy
+
+def parse_shard(value):
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, e.g. 0/4, got {value!r}")
+    if not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"shard index must be in 0..{count - 1}, got {index}")
+    return index, count
+
+def parse_slice(value):
+    """START:END (manifest lines, either end optional) or I/N (every Nth line from line I)."""
+    if "/" in value:
+        index, count = parse_shard(value)
+        return slice(index, None, count)
+    try:
+        start, end = (int(part) if part else None for part in value.split(":"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected START:END or I/N, got {value!r}")
+    if (start or 0) < 0 or (end or 0) < 0:
+        raise argparse.ArgumentTypeError(f"slice bounds must not be negative, got {value!r}")
+    return slice(start, end)
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Download all image attachments from a ClickUp workspace.")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only list tasks updated since the last clean pass over each list, "
+                             "and revisit processed tasks that changed")
+    parser.add_argument("--retry-failed", action="store_true",
+                        help="only replay the retryable entries of the failure log, without rescanning the workspace")
+    parser.add_argument("--blob-store", action="store_true",
+                        help=f"store each distinct image once under {BLOB_DIR} and hardlink "
+                             "(or symlink) the space/list paths to it")
+    parser.add_argument("--profile", nargs="?", const=str(PROFILE_FILE), metavar="PATH",
+                        help=f"run under cProfile, dump the stats to PATH (default {PROFILE_FILE}) "
+                             "and show per-phase timings in the summary")
+    parser.add_argument("--headless", action="store_true",
+                        help="no rich output: emit JSON-lines events (progress every PROGRESS_INTERVAL seconds, "
+                             "errors, summary) for cron and log collectors")
+    parser.add_argument("--events", default="-", metavar="PATH",
+                        help="with --headless, append the events to PATH instead of stdout")
+    parser.add_argument("--refresh-hierarchy", action="store_true",
+                        help="fetch the space/folder/list tree again even if a cached copy is younger than HIERARCHY_TTL")
+    parser.add_argument("--shard", type=parse_shard, metavar="I/N",
+                        help="only handle the lists that hash into shard I of N (0-based), "
+                             "keeping state in its own partition of the state database")
+    commands = parser.add_subparsers(dest="command", metavar="COMMAND")
+    plan = commands.add_parser("plan", help="list every image attachment in a JSON-lines manifest without downloading")
+    plan.add_argument("manifest", nargs="?", default="manifest.jsonl", type=pathlib.Path,
+                      help="where to write the manifest (default manifest.jsonl)")
+    execute = commands.add_parser("execute", help="download the attachments listed in a manifest")
+    execute.add_argument("manifest", type=pathlib.Path, help="a manifest written by plan")
+    execute.add_argument("--slice", type=parse_slice, default=slice(None), metavar="START:END|I/N",
+                         help="only lines START to END-1 (0-based), or every Nth line starting at line I")
+    merge = commands.add_parser("merge-state",
+                                help="merge the --shard state partitions into the canonical state database")
+    merge.add_argument("--remove", action="store_true", help="delete the partitions and their metrics files once merged")
+    return parser.parse_args(argv)
+
+def run_command(args):
+    """Run the selected command; returns (download pool or None, summary text, summary event fields)."""
     # Load processed tasks for resumption
     processed_tasks = load_processed_tasks()
     
     # Display header
-    console.print(Panel.fit(
+    report(Panel.fit(
         "[bold blue]ClickUp Image Downloader[/bold blue]\n"
         f"Output Directory: [green]{OUT_DIR}[/green]\n"
-        f"Previously processed tasks: [yellow]{len(processed_tasks)}[/yellow]",
+        f"Previously processed tasks: [yellow]{len(processed_tasks)}[/yellow]"
+        + ("\nMode: [yellow]incremental[/yellow]" if args.incremental else "")
+        + ("\nMode: [yellow]retry failed downloads[/yellow]" if args.retry_failed and not args.command else "")
+        + (f"\nMode: [yellow]{args.command} {args.manifest}[/yellow]" if args.command else "")
+        + (f"\nShard: [yellow]{SHARD[0]}/{SHARD[1]}[/yellow]" if SHARD else ""),
         border_style="blue"
-    ))
-    
-    with console.status("[bold green]Fetching spaces...") as status:
-        spaces = get_spaces()
-    
-    console.print(f"[green]✓[/green] Found {len(spaces)} space(s)")
+    ), "start", out_dir=str(OUT_DIR), processed_tasks=len(processed_tasks),
+       incremental=args.incremental, retry_failed=args.retry_failed, shard=SHARD, command=args.command)
     
-    # Count total tasks for progress tracking
-    total_tasks = 0
-    remaining_tasks = 0
-    all_lists = []
+    # Index what is already on disk once, instead of a stat() per attachment
+    if args.command != "plan":
+        started = time.perf_counter()
+        status = console.status(f"[bold green]Indexing {OUT_DIR}...") if EVENTS is None else nullcontext()
+        with status, PHASES.time("file index"):
+            indexed = len(get_files().files)
+        elapsed = time.perf_counter() - started
+        report(f"[green]✓[/green] Indexed {indexed} existing file(s) in {elapsed:.1f}s",
+               "indexed", files=indexed, seconds=round(elapsed, 3))
     
-    with console.status("[bold green]Counting tasks...") as status:
-        for sid, sname in spaces.items():
-            lists = get_folder_lists(sid)
-            for lst in lists:
-                tasks = list(iter_tasks(lst["id"]))
-                task_count = len(tasks)
-                remaining_count = len([t for t in tasks if t["id"] not in processed_tasks])
-                all_lists.append((sid, sname, lst, tasks))
-                total_tasks += task_count
-                remaining_tasks += remaining_count
-    
-    console.print(f"[green]✓[/green] Found {total_tasks} total tasks ({remaining_tasks} remaining to process)")
+    if args.command == "plan":
+        hierarchy = discover_workspace(refresh=args.refresh_hierarchy)
+        # A full plan lists every task; --incremental plans only what an incremental run would fetch
+        with open(args.manifest, "w") as manifest, make_progress() as progress:
+            pipeline = PlanPipeline(hierarchy, processed_tasks if args.incremental else {}, manifest, progress,
+                                    incremental=args.incremental)
+            pipeline.run()
+        pool = None
+        found_text = (f"Planned [bold cyan]{pipeline.planned}[/bold cyan] images from {pipeline.remaining_tasks} tasks "
+                      f"into [green]{args.manifest}[/green]\n")
+        found = {'tasks': pipeline.remaining_tasks, 'planned': pipeline.planned, 'manifest': str(args.manifest)}
+    elif args.command == "execute":
+        entries = skipped = 0
+        with make_progress() as progress, DownloadPool(blob_store=args.blob_store) as pool:
+            entry_bar = progress.add_task(f"[cyan]Executing {args.manifest.name}", total=0, windows=True, name="entries")
+            for entry in read_manifest(args.manifest, args.slice):
+                entries += 1
+                progress.update(entry_bar, total=entries)
+                key = pathlib.PurePath(entry["path"])
+                if key.is_absolute() or ".." in key.parts:
+                    report(f"[red]  Skipping manifest entry outside {OUT_DIR}: {key}[/red]",
+                           "error", path=str(key), error="outside output directory")
+                    skipped += 1
+                    progress.update(entry_bar, advance=1)
+                    continue
+                dest = OUT_DIR / key
+                if is_duplicate(dest, entry["url"]):
+                    skipped += 1
+                    progress.update(entry_bar, advance=1)
+                    continue
+                future = pool.submit(entry["url"], dest)
+                future.add_done_callback(lambda _: progress.update(entry_bar, advance=1))
+        found_text = f"Executed {entries} manifest entries from [green]{args.manifest}[/green] ({skipped} skipped)\n"
+        found = {'entries': entries, 'skipped': skipped}
+    elif args.retry_failed:
+        entries = get_state().retryable_failures()
+        report(f"[green]✓[/green] Replaying {len(entries)} failed download(s)", "retrying", downloads=len(entries))
+        with make_progress() as progress, DownloadPool(blob_store=args.blob_store) as pool:
+            retry_bar = progress.add_task("[cyan]Retrying failed downloads", total=len(entries), windows=True,
+                                         name="retries")
+            for dest_key, url in entries:
+                dest = OUT_DIR / dest_key
+                if is_duplicate(dest, url):
+                    get_state().clear_failures(dest_key)
+                    progress.update(retry_bar, advance=1)
+                    continue
+                future = pool.submit(url, dest)
+                future.add_done_callback(lambda _: progress.update(retry_bar, advance=1))
+        found_text = f"Retried {len(entries)} failed download(s)\n"
+        found = {'retried': len(entries)}
+    else:
+        hierarchy = discover_workspace(refresh=args.refresh_hierarchy)
+        
+        # Enumeration, detail fetches and downloads run concurrently
+        with make_progress() as progress, DownloadPool(blob_store=args.blob_store) as pool:
+            pipeline = TaskPipeline(hierarchy, processed_tasks, pool, progress, incremental=args.incremental)
+            pipeline.run()
+        found_text = f"Found {pipeline.total_tasks} tasks ({pipeline.remaining_tasks} processed this run)\n"
+        found = {'tasks': pipeline.total_tasks, 'processed': pipeline.remaining_tasks}
+    return pool, found_text, found
+
+def main(argv=None):
+    global EVENTS, SHARD
+    args = parse_args(argv)
+    if args.headless:
+        EVENTS = EventLog(sys.stdout if args.events == "-" else open(args.events, "a"))
+    if args.command == "merge-state":
+        for path, counts in merge_state(remove=args.remove):
+            report(f"[green]✓[/green] Merged {path.name}: {counts['downloads']} downloads, "
+                   f"{counts['processed_tasks']} processed tasks, {counts['failed_downloads']} failures, "
+                   f"{counts['renamed']} renamed",
+                   "merged", partition=path.name, **counts)
+        return
+    SHARD = args.shard
     
-    total_imgs = 0
-    failed_downloads = 0
+    # Create output directory
+    OUT_DIR.mkdir(exist_ok=True)
+    METRICS.start_periodic()
+    profiler = Profiler() if args.profile else None
+    pool, found_text, found = profiler.run(args.profile, run_command, args) if profiler else run_command(args)
     
-    # Main progress tracking
-    with Progress(
-        SpinnerColumn(),
-        TextColumn("[progress.description]{task.description}"),
-        BarColumn(),
-        MofNCompleteColumn(),
-        TaskProgressColumn(),
-        TimeElapsedColumn(),
-        console=console,
-        expand=True
-    ) as progress:
-        
-        main_task = progress.add_task("[cyan]Processing all tasks...", total=remaining_tasks)
-        
-        for sid, sname, lst, tasks in all_lists:
-            lname = lst["name"]
-            remaining_list_tasks = [t for t in tasks if t["id"] not in processed_tasks]
-            
-            if not remaining_list_tasks:
-                continue
-                
-            list_task = progress.add_task(f"[yellow]{sname}/{lname}", total=len(remaining_list_tasks))
-            
-            task_counter = 0
-            for task in remaining_list_tasks:
-                task_counter += 1
-                progress.update(list_task, advance=1, description=f"[yellow]{sname}/{lname} - Task {task_counter}/{len(remaining_list_tasks)}")
-                progress.update(main_task, advance=1)
-                
-                try:
-                    tdata = api_get(f"{BASE}/task/{task['id']}")
-                    
-                    for att in tdata.get("attachments", []):
-                        if att.get("mimetype", "").startswith("image/"):
-                            fname = att.get("title") or att.get("filename")
-                            path = OUT_DIR / sname / lname / fname
-                            
-                            # Check for duplicates using improved method
-                            if not is_duplicate(path, att["url"]):
-                                console.print(f"[dim]  Downloading: {fname}[/dim]")
-                                success = download(att["url"], path)
-                                if success:
-                                    total_imgs += 1
-                                else:
-                                    failed_downloads += 1
-                                    console.print(f"[red]  Failed to download: {fname}[/red]")
-                                time.sleep(RATE_DELAY)
-                            else:
-                                console.print(f"[dim]  Skipping duplicate: {fname}[/dim]")
-                    
-                    # Mark task as processed
-                    mark_task_processed(task["id"])
-                    
-                except Exception as e:
-                    console.print(f"[red]  Error processing task {task['id']}: {str(e)}[/red]")
-                    continue
-                
-                time.sleep(RATE_DELAY)
-            
-            progress.remove_task(list_task)
+    total_imgs = pool.downloaded if pool else 0
+    failed_downloads = pool.failed if pool else 0
+    get_state().flush()
+    METRICS.stop()
     
     # Final summary
     summary_text = f"[bold green]✓ Complete![/bold green]\n"
-    summary_text += f"Downloaded [bold cyan]{total_imgs}[/bold cyan] images\n"
+    summary_text += found_text
+    if pool:
+        summary_text += f"Downloaded [bold cyan]{total_imgs}[/bold cyan] images\n"
     if failed_downloads > 0:
-        summary_text += f"Failed downloads: [bold red]{failed_downloads}[/bold red] (see .failed_downloads.json)\n"
+        summary_text += f"Failed downloads: [bold red]{failed_downloads}[/bold red] (see failed_downloads in {shard_path(STATE_DB).name})\n"
+    if _cache is not None and _cache.hits + _cache.misses:
+        summary_text += f"Task detail cache: [cyan]{_cache.hits}[/cyan] hits, [cyan]{_cache.misses}[/cyan] misses\n"
+    summary_text += f"Connections: [cyan]{CLIENT.connections_opened}[/cyan] opened, [cyan]{CLIENT.connections_reused}[/cyan] reused\n"
+    summary_text += f"Metrics: [green]{shard_path(METRICS_JSON).name}[/green], [green]{shard_path(METRICS_PROM).name}[/green]\n"
+    if profiler:
+        summary_text += "Phases (busy / wall):\n"
+        for phase, calls, busy, wall in PHASES.summary():
+            summary_text += f"  {phase:<20} [cyan]{busy:8.2f}s[/cyan] / [cyan]{wall:7.2f}s[/cyan] over {calls} call(s)\n"
+        summary_text += f"Profile: [green]{args.profile}[/green]\n"
     summary_text += f"Saved to: [green]{OUT_DIR.absolute()}[/green]"
     
-    console.print(Panel.fit(summary_text, border_style="green"))
+    report(Panel.fit(summary_text, border_style="green"), "summary", **found,
+           downloaded=total_imgs, failed=failed_downloads,
+           task_cache_hits=_cache.hits if _cache else 0,
+           connections_opened=CLIENT.connections_opened, connections_reused=CLIENT.connections_reused,
+           phases={phase: {'calls': calls, 'busy': round(busy, 3), 'wall': round(wall, 3)}
+                   for phase, calls, busy, wall in PHASES.summary()} if profiler else None,
+           profile=args.profile)
 
 if __name__ == "__main__":
     main()